@@ -3,16 +3,30 @@
 
 import os
 import re
-import json
 import uuid
 import time
 import glob
 import argparse
+import threading
 from datetime import datetime
-from .twitter import Twitter
+from .twitter import Twitter, StopQuery
 from .telegram import Telegram
 from .utility import Utility
-from .output import store_result
+from .output import store_result, configure_dedup, configure_columns, configure_stdout, save_dedup, DATABASE_NAME
+from .dedup import build_dedup_dir
+from .writers import configure_writers, close_writers, writer_sizes, truncate_files, COMPRESSIONS
+from .parquet import close_tables
+from .database import commit_databases, close_databases
+from .pipeline import Pipeline, DROP_POLICIES
+from .serialize import BACKENDS, select_backend
+from .crawler import Frontier, build_frontier_path, PRIORITIES, DIRECTIONS
+from .state import StateStore, build_state_dir
+from .lookup import ProfileCache
+from .keypool import KeyPool
+
+
+TIME_UNITS = {'s': 1, 'm': 60, 'h': 60 * 60, 'd': 24 * 60 * 60}
+SIZE_UNITS = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
 
 
 def main(cwd=None):
@@ -58,6 +72,126 @@ def main(cwd=None):
         action='store_true',
         help="Stores results as jsonl",
     )
+    parser.add_argument(
+        "--parquet",
+        action='store_true',
+        help="Stores results as parquet, requires pyarrow",
+    )
+    parser.add_argument(
+        "--sqlite",
+        action='store_true',
+        help="Stores results in the sqlite database openglass.db of the output directory",
+    )
+    parser.add_argument(
+        "--flush-size",
+        metavar="BYTES",
+        default=None,
+        help="Specify how many bytes are buffered before writing them to the output files",
+    )
+    parser.add_argument(
+        "--flush-interval",
+        metavar="SECONDS",
+        default=None,
+        help="Specify how often the buffered results are written to the output files",
+    )
+    parser.add_argument(
+        "--dedup",
+        choices=['exact', 'bloom'],
+        default='exact',
+        help="How to remember the users and tweets already stored as csv. bloom uses bounded memory but may skip a few new entries",
+    )
+    parser.add_argument(
+        "--dedup-capacity",
+        metavar="NUMBER OF ENTRIES",
+        default='10000000',
+        help="Specify how many users or tweets the bloom dedup is sized for",
+    )
+    parser.add_argument(
+        "--dedup-error-rate",
+        metavar="RATE",
+        default='0.001',
+        help="Specify the false positive rate of the bloom dedup",
+    )
+    parser.add_argument(
+        "--keep-duplicate-relations",
+        action='store_true',
+        help="Store a relation every time it is found, for example each time the same tweet is retweeted",
+    )
+    parser.add_argument(
+        "--dedup-persist",
+        action='store_true',
+        help="Remember the users and tweets stored in the output directory across runs",
+    )
+    parser.add_argument(
+        "--writer-threads",
+        metavar="NUMBER OF THREADS",
+        default='0',
+        help="Specify how many threads store the results in the background, 0 stores them while querying",
+    )
+    parser.add_argument(
+        "--queue-size",
+        metavar="NUMBER OF RESULTS",
+        default='10000',
+        help="Specify how many results can wait to be stored by the writer threads",
+    )
+    parser.add_argument(
+        "--drop-policy",
+        choices=DROP_POLICIES,
+        default='block',
+        help="What to do when the writer threads fall behind: wait, drop the new results or drop the oldest ones",
+    )
+    parser.add_argument(
+        "--json-backend",
+        choices=BACKENDS,
+        default='auto',
+        help="Library used to encode json, auto uses orjson or ujson when installed",
+    )
+    parser.add_argument(
+        "--raw-json",
+        action='store_true',
+        help="Decode the twitter responses with the json library straight to the output, without building tweepy objects",
+    )
+    parser.add_argument(
+        "--compact",
+        action='store_true',
+        help="Print results as one line of json each instead of indented json",
+    )
+    parser.add_argument(
+        "--compress",
+        choices=COMPRESSIONS,
+        default=None,
+        help="Compress the csv and jsonl output files, zstd requires zstandard",
+    )
+    parser.add_argument(
+        "--rotate-size",
+        metavar="SIZE",
+        default=None,
+        help="Start a new csv or jsonl file after this many bytes. Example 500K, 100M, 1G",
+    )
+    parser.add_argument(
+        "--rotate-entries",
+        metavar="NUMBER OF ROWS",
+        default=None,
+        help="Start a new csv or jsonl file after this many rows",
+    )
+    parser.add_argument(
+        "--rotate-interval",
+        metavar="Amount of time",
+        default=None,
+        help="Start a new csv or jsonl file after this amount of time. Example 100s, 5h, 3d",
+    )
+    parser.add_argument(
+        "--user-columns",
+        metavar="ATTRIBUTES",
+        default=None,
+        help="Comma separated attributes of share/models/twitter_user.yml stored as csv or parquet columns",
+    )
+    parser.add_argument(
+        "--tweet-columns",
+        metavar="ATTRIBUTES",
+        default=None,
+        help="Comma separated attributes of share/models/tweet.yml stored as csv or parquet columns",
+    )
     parser.add_argument(
         "--output",
         metavar="output directory",
@@ -74,6 +208,12 @@ def main(cwd=None):
         default=None,
         help="Specify the terms to search for old tweets",
     )
+    parser.add_argument(
+        "--search-slices",
+        metavar="NUMBER OF SLICES",
+        default=None,
+        help="Split the time covered by --search in slices searched in parallel, one thread per api key",
+    )
     parser.add_argument(
         "--search-new",
         metavar="SEARCH QUERY",
@@ -82,9 +222,9 @@ def main(cwd=None):
     )
     parser.add_argument(
         "--timeline",
-        metavar="USERNAME OR ID",
+        metavar="USERNAMES OR IDS",
         default=None,
-        help="Specify the user to retrieve its past tweets",
+        help="Specify the users to retrieve their past tweets, using one thread per api key",
     )
     parser.add_argument(
         "--timeline-new",
@@ -100,15 +240,21 @@ def main(cwd=None):
     )
     parser.add_argument(
         "--followers",
-        metavar="USERNAME OR ID",
+        metavar="USERNAMES OR IDS",
         default=None,
-        help="Specify the user to retrieve the users that follow him/her",
+        help="Specify the users to retrieve the users that follow them, using one thread per api key",
     )
     parser.add_argument(
         "--friends",
-        metavar="USERNAME OR ID",
+        metavar="USERNAMES OR IDS",
+        default=None,
+        help="Specify the users to retrieve the users they are following, using one thread per api key",
+    )
+    parser.add_argument(
+        "--ids",
+        choices=['hydrate', 'edges'],
         default=None,
-        help="Specify the user to retrieve the users that is following",
+        help="Page --followers and --friends by id, 5000 per request, and look up their profiles or only store the relations",
     )
     parser.add_argument(
         "--retweeters",
@@ -128,6 +274,75 @@ def main(cwd=None):
         default=None,
         help="Specify the users to retrieve all their new tweets and their retweets",
     )
+    parser.add_argument(
+        "--crawl",
+        metavar="USERNAMES OR IDS",
+        default=None,
+        help="Specify the users to start a crawl of the follower graph from",
+    )
+    parser.add_argument(
+        "--crawl-hops",
+        metavar="NUMBER OF HOPS",
+        default='2',
+        help="Specify how many hops the crawl goes away from the seed users",
+    )
+    parser.add_argument(
+        "--crawl-direction",
+        choices=DIRECTIONS,
+        default='followers',
+        help="Specify if the crawl follows the followers, the friends or both",
+    )
+    parser.add_argument(
+        "--crawl-priority",
+        choices=PRIORITIES,
+        default='followers',
+        help="Specify which users of a hop are expanded first: most followers, most related to the crawled users or first found",
+    )
+    parser.add_argument(
+        "--crawl-hop-limit",
+        metavar="NUMBER OF USERS",
+        default=None,
+        help="Specify how many users are expanded at most in each hop",
+    )
+    parser.add_argument(
+        "--incremental",
+        action='store_true',
+        help="Only retrieve the tweets newer than the ones of the last --timeline or --search of the same users or terms",
+    )
+    parser.add_argument(
+        "--resume",
+        action='store_true',
+        help="Continue the last run of the same query and output from its last checkpoint",
+    )
+    parser.add_argument(
+        "--shared-keys",
+        action='store_true',
+        help="Share the rate limits of the api keys with the other openglass processes of this host",
+    )
+    parser.add_argument(
+        "--profile-cache-ttl",
+        metavar="NUMBER OF HOURS",
+        default=None,
+        help="Keep the user profiles looked up on disk and reuse them in later runs for this many hours",
+    )
+    parser.add_argument(
+        "--stream-rotation",
+        metavar="NUMBER OF MINUTES",
+        default=None,
+        help="Specify every how many minutes streams move to the next api key, 0 keeps the same key (default 15)",
+    )
+    parser.add_argument(
+        "--stream-threads",
+        metavar="NUMBER OF THREADS",
+        default='1',
+        help="Specify how many threads process the tweets received by streams",
+    )
+    parser.add_argument(
+        "--stream-queue-size",
+        metavar="NUMBER OF TWEETS",
+        default='100000',
+        help="Specify how many tweets received by streams can wait to be processed",
+    )
     parser.add_argument(
         "--run-for",
         metavar="Amount of time",
@@ -187,14 +402,19 @@ def main(cwd=None):
             )
         return
 
-    file_outputs = ['csv', 'jsonl']
+    file_outputs = ['csv', 'jsonl', 'parquet', 'sqlite']
     num_output = sum([1 for elem in file_outputs if getattr(args, elem) is True])
     if num_output > 1:
-        print('decide between --csv and --jsonl')
+        print('decide between --csv, --jsonl, --parquet and --sqlite')
         return
 
     if num_output == 0 and args.output is not None:
-        print('to select an output directory, supply --csv or --jsonl')
+        print('to select an output directory, supply --csv, --jsonl, --parquet or --sqlite')
+        return
+    output_format = next((elem for elem in file_outputs if getattr(args, elem) is True), None)
+
+    if (args.parquet or args.sqlite) and args.telegram:
+        print('--parquet and --sqlite can only be used with --twitter')
         return
 
     if args.output is not None:
@@ -212,7 +432,7 @@ def main(cwd=None):
         print('decide between --twitter and --telegram')
         return
 
-    twitter_actions = ['search', 'search_new', 'timeline', 'timeline_new', 'profile', 'followers', 'friends', 'retweeters', 'retweeters_new', 'watch']
+    twitter_actions = ['search', 'search_new', 'timeline', 'timeline_new', 'profile', 'followers', 'friends', 'retweeters', 'retweeters_new', 'watch', 'crawl']
     num_actions = sum([1 for elem in twitter_actions if getattr(args, elem) is not None])
 
     if args.twitter and num_actions != 1:
@@ -231,24 +451,62 @@ def main(cwd=None):
         print('telegram options are not allowded with --twitter')
         return
 
+    if args.ids and not (args.followers or args.friends or args.crawl):
+        print('--ids can only be used with --followers, --friends or --crawl')
+        return
+
+    if args.search_slices and not (args.twitter and args.search):
+        print('--search-slices can only be used with --twitter and --search')
+        return
+
+    if args.stream_rotation is not None:
+        if not (args.twitter and (args.search_new or args.timeline_new or args.watch)):
+            print('--stream-rotation can only be used with --search-new, --timeline-new or --watch')
+            return
+        value = args.stream_rotation
+        try:
+            args.stream_rotation = int(value)
+        except ValueError:
+            args.stream_rotation = -1
+        if args.stream_rotation < 0:
+            print(f'invalid value for --stream-rotation: {value}')
+            return
+
+    if args.shared_keys and not args.twitter:
+        print('--shared-keys can only be used with --twitter')
+        return
+
+    if args.raw_json and not args.twitter:
+        print('--raw-json can only be used with --twitter')
+        return
+
+    if args.profile_cache_ttl and not args.twitter:
+        print('--profile-cache-ttl can only be used with --twitter')
+        return
+
+    for option in ['crawl_hops', 'crawl_hop_limit', 'search_slices', 'profile_cache_ttl', 'stream_threads', 'stream_queue_size']:
+        value = getattr(args, option)
+        if value is None:
+            continue
+        try:
+            number = int(value)
+        except ValueError:
+            number = 0
+        if number <= 0:
+            print('invalid value for --{}: {}'.format(option.replace('_', '-'), value))
+            return
+        setattr(args, option, number)
+
     if args.run_for and args.telegram:
         print('--run-for can only be used with --twitter')
         return
 
     if args.run_for:
-        if re.search(r'^\d+[smhd]$', args.run_for) is None:
+        run_for = parse_amount(args.run_for, TIME_UNITS)
+        if run_for is None:
             print(f'invalid format for --run-for: {args.run_for}')
             return
-        amount = args.run_for[:-1]
-        span = args.run_for[-1]
-        if span == 's':
-            args.run_for = int(amount)
-        if span == 'm':
-            args.run_for = int(amount) * 60
-        if span == 'h':
-            args.run_for = int(amount) * 60 * 60
-        if span == 'd':
-            args.run_for = int(amount) * 24 * 60 * 60
+        args.run_for = run_for
     else:
         args.run_for = None
 
@@ -259,6 +517,105 @@ def main(cwd=None):
             print(f'invalid value for --max-results: {args.max_results}')
             return
 
+    for option in ['writer_threads', 'queue_size']:
+        try:
+            setattr(args, option, int(getattr(args, option)))
+        except ValueError:
+            print('invalid value for --{}: {}'.format(option.replace('_', '-'), getattr(args, option)))
+            return
+
+    for option in ['flush_size', 'flush_interval']:
+        value = getattr(args, option)
+        if value is None:
+            continue
+        try:
+            setattr(args, option, int(value))
+        except ValueError:
+            print('invalid value for --{}: {}'.format(option.replace('_', '-'), value))
+            return
+
+    for option, units in [('rotate_size', SIZE_UNITS), ('rotate_entries', {'': 1}), ('rotate_interval', TIME_UNITS)]:
+        value = getattr(args, option)
+        if value is None:
+            continue
+        setattr(args, option, parse_amount(value, units))
+        if getattr(args, option) is None:
+            print('invalid format for --{}: {}'.format(option.replace('_', '-'), value))
+            return
+    rotate = args.rotate_size or args.rotate_entries or args.rotate_interval
+    if (rotate or args.compress) and not (args.csv or args.jsonl):
+        print('--compress and --rotate-* can only be used with --csv or --jsonl')
+        return
+    try:
+        configure_writers(args.flush_size, args.flush_interval, args.compress,
+                          args.rotate_size, args.rotate_entries, args.rotate_interval)
+    except Exception as e:
+        print(e)
+        return
+
+    try:
+        select_backend(args.json_backend)
+    except Exception as e:
+        print(e)
+        return
+    configure_stdout(args.compact)
+
+    if (args.user_columns or args.tweet_columns) and not (args.csv or args.parquet):
+        print('--user-columns and --tweet-columns can only be used with --csv or --parquet')
+        return
+    try:
+        configure_columns(
+            args.user_columns.split(',') if args.user_columns else None,
+            args.tweet_columns.split(',') if args.tweet_columns else None,
+        )
+    except Exception as e:
+        print(e)
+        return
+
+    try:
+        args.dedup_capacity = int(args.dedup_capacity)
+        args.dedup_error_rate = float(args.dedup_error_rate)
+    except ValueError:
+        print('invalid value for --dedup-capacity or --dedup-error-rate')
+        return
+    if args.dedup_capacity <= 0 or not 0 < args.dedup_error_rate < 1:
+        print('--dedup-capacity must be positive and --dedup-error-rate between 0 and 1')
+        return
+    if args.dedup_persist and not (args.csv or args.parquet):
+        print('--dedup-persist can only be used with --csv or --parquet')
+        return
+    if args.incremental and not (args.twitter and (args.timeline or args.search)):
+        print('--incremental can only be used with --timeline or --search')
+        return
+
+    if args.resume and not args.twitter:
+        print('--resume can only be used with --twitter')
+        return
+    if args.resume and (args.parquet or args.compress or rotate):
+        print('--resume can not be used with --parquet, --compress or --rotate-*')
+        return
+
+    # twitter queries save their cursors and the size of their output files as
+    # they go, parquet and compressed files can not be cut back to a checkpoint
+    state = None
+    resumed = False
+    if args.twitter and not (args.parquet or args.compress or rotate):
+        action = next(elem for elem in twitter_actions if getattr(args, elem) is not None)
+        job = '{}:{}:{}:{}'.format(action, getattr(args, action), os.path.abspath(args.output), output_format)
+        state_dir = build_state_dir(utility.build_persistent_dir(), job, clear=not args.resume)
+        state = StateStore(state_dir)
+        resumed = state.load()
+        if args.resume and not resumed:
+            print('there is no checkpoint to resume, starting from the beginning')
+
+    dedup_dir = None
+    if args.dedup_persist:
+        dedup_dir = build_dedup_dir(utility.build_persistent_dir(), args.output)
+    elif state is not None and output_format == 'csv':
+        # a resumed run skips the users and tweets stored before the checkpoint
+        dedup_dir = state_dir
+    configure_dedup(args.dedup, args.dedup_capacity, args.dedup_error_rate, dedup_dir, not args.keep_duplicate_relations)
+
     # Re-load settings, if a custom config was passed in
     if args.config:
         utility.load_settings(args.config)
@@ -266,101 +623,199 @@ def main(cwd=None):
         utility.load_settings()
 
     start_time = int(time.time())
+    if resumed:
+        start_time = state.get('start_time')
+        print('resuming the run started at: {}'.format(datetime.fromtimestamp(start_time).strftime("%B %d, %H:%M")))
+        # rows written after the checkpoint are written again by the resumed run
+        truncate_files(glob.glob(f'{args.output}/*_{start_time}.{output_format}'), state.get('files', {}), state.get('saved_at', 0))
+    if state is not None:
+        state.set('start_time', start_time)
     now = datetime.now()
     print('started at: {}'.format(now.strftime("%B %d, %H:%M")))
 
     number_of_results = 0
     filename = ''
+    pipeline = None
+    interrupted = False
 
     if args.twitter:
 
+        def store_entry(item):
+            obj, entry, timestamp = item
+            entry = standarize_entry(obj, entry, timestamp)
+            store_result(args.output, entry, output_format, filename, start_time)
+
+        if args.writer_threads > 0:
+            pipeline = Pipeline(store_entry, args.writer_threads, args.queue_size, args.drop_policy, name='writer')
+
+        handler_lock = threading.Lock()
+
         def entry_handler(obj, entry):
+            '''
+            stores an entry, streams call it from several threads at once so
+            entries are prepared in parallel and only stored one at a time
+            '''
             nonlocal number_of_results
-            number_of_results += 1
-            if args.jsonl or args.csv:
-                print('Number of results: {}'.format(number_of_results), end='\r')
-            entry = standarize_entry(obj, entry)
-            store_result(args.output, entry, args.csv, args.jsonl, filename, start_time)
-            if args.run_for and time.time() - start_time > args.run_for:
-                raise KeyboardInterrupt
-            if args.max_results and number_of_results >= args.max_results:
-                raise KeyboardInterrupt
+            timestamp = int(time.time())
+            if pipeline is None:
+                entry = standarize_entry(obj, entry, timestamp)
+            with handler_lock:
+                number_of_results += 1
+                if output_format is not None and pipeline is not None:
+                    print('Number of results: {} (queued: {}, dropped: {})'.format(number_of_results, pipeline.depth, pipeline.dropped), end='\r')
+                elif output_format is not None:
+                    print('Number of results: {}'.format(number_of_results), end='\r')
+                if pipeline is not None:
+                    pipeline.put((obj, entry, timestamp))
+                else:
+                    store_result(args.output, entry, output_format, filename, start_time)
+                if args.run_for and time.time() - start_time > args.run_for:
+                    raise StopQuery
+                if args.max_results and number_of_results >= args.max_results:
+                    raise StopQuery
 
         if args.config:
             utility.load_settings(args.config)
         else:
             utility.load_settings()
 
-        t = Twitter(utility.get_setting('twitter_apis'))
+        limiter = None
+        if args.shared_keys:
+            limiter = KeyPool(os.path.join(utility.build_persistent_dir(), 'keypool.db'))
+        t = Twitter(utility.get_setting('twitter_apis'), limiter, raw_json=args.raw_json)
+
+        def save_outputs():
+            '''writes the results handled so far, called before each checkpoint'''
+            if pipeline is not None:
+                pipeline.wait()
+            commit_databases()
+            save_dedup()
+            files = state.get('files', {})
+            files.update(writer_sizes())
+            return {'files': files, 'saved_at': time.time()}
+
+        if state is not None:
+            state.before_save = save_outputs
+            t.state = state
+
+        if args.stream_rotation is not None:
+            t.stream_rotation = args.stream_rotation * 60 if args.stream_rotation > 0 else None
+        t.stream_threads = args.stream_threads
+        t.stream_queue_size = args.stream_queue_size
+
+        if args.profile_cache_ttl:
+            t.profiles = ProfileCache(os.path.join(utility.build_persistent_dir(), 'profiles.db'), args.profile_cache_ttl * 60 * 60)
+
+        if args.incremental:
+            since_ids = StateStore(build_state_dir(utility.build_persistent_dir(), 'since_ids'))
+            since_ids.load()
+            t.since_ids = since_ids
         if args.search:
             print('Press Ctrl-C to exit')
             filename = 'search_{}'.format(args.search.replace(' ', '_'))
             try:
-                t.search(args.search, entry_handler)
+                t.search(args.search, entry_handler, args.search_slices)
             except KeyboardInterrupt:
-                pass
+                interrupted = True
         if args.search_new:
             print('Press Ctrl-C to exit')
             filename = 'search_new_{}'.format(args.search_new.replace(' ', '_'))
             try:
                 t.search_new(args.search_new, entry_handler)
             except KeyboardInterrupt:
-                pass
+                interrupted = True
         elif args.timeline:
             print('Press Ctrl-C to exit')
             filename = 'timeline_{}'.format(args.timeline.replace(' ', '_'))
             try:
-                t.get_timeline(args.timeline, entry_handler, args.max_results)
+                t.crawl('get_timeline', args.timeline.split(' '), entry_handler, args.max_results)
             except KeyboardInterrupt:
-                pass
+                interrupted = True
         elif args.timeline_new:
             print('Press Ctrl-C to exit')
             filename = 'timeline_new_{}'.format(args.timeline_new.replace(' ', '_'))
             try:
                 t.get_timeline_new(args.timeline_new.split(' '), entry_handler)
             except KeyboardInterrupt:
-                pass
+                interrupted = True
         elif args.profile:
             filename = 'profile_{}'.format(args.profile.replace(' ', '_'))
             profile = t.get_profile(args.profile)
             profile = standarize_entry(t, profile)
             number_of_results += 1
-            store_result(args.output, profile, args.csv, args.jsonl, filename, start_time)
+            store_result(args.output, profile, output_format, filename, start_time)
         elif args.followers:
             print('Press Ctrl-C to exit')
             filename = 'followers_{}'.format(args.followers.replace(' ', '_'))
             try:
-                t.get_followers(args.followers, entry_handler, args.max_results)
+                t.crawl('get_followers', args.followers.split(' '), entry_handler, args.max_results, ids=args.ids)
             except KeyboardInterrupt:
-                pass
+                interrupted = True
         elif args.friends:
             print('Press Ctrl-C to exit')
             filename = 'friends_{}'.format(args.friends.replace(' ', '_'))
             try:
-                t.get_friends(args.friends, entry_handler, args.max_results)
+                t.crawl('get_friends', args.friends.split(' '), entry_handler, args.max_results, ids=args.ids)
             except KeyboardInterrupt:
-                pass
+                interrupted = True
         elif args.retweeters:
             print('Press Ctrl-C to exit')
             filename = 'retweeters_{}'.format(args.retweeters.replace(' ', '_'))
             try:
                 t.get_retweeters(args.retweeters, entry_handler)
             except KeyboardInterrupt:
-                pass
+                interrupted = True
         elif args.retweeters_new:
             print('Press Ctrl-C to exit')
             filename = 'retweeters_new_{}'.format(args.retweeters_new.replace(' ', '_'))
             try:
                 t.get_retweeters_new(args.retweeters_new.split(' '), entry_handler)
             except KeyboardInterrupt:
-                pass
+                interrupted = True
         elif args.watch:
             print('Press Ctrl-C to exit')
             filename = 'watch_{}'.format(args.watch.replace(' ', '_'))
             try:
                 t.watch(args.watch.split(' '), entry_handler)
             except KeyboardInterrupt:
-                pass
+                interrupted = True
+        elif args.crawl:
+            print('Press Ctrl-C to exit')
+            filename = 'crawl_{}'.format(args.crawl.replace(' ', '_'))
+            seeds = args.crawl.split(' ')
+            frontier_path = build_frontier_path(utility.build_persistent_dir(), seeds, args.crawl_hops, args.crawl_direction, args.crawl_priority)
+            frontier = Frontier(frontier_path, args.crawl_priority)
+            if frontier.expanded() > 0:
+                print('resuming crawl, {} users already expanded'.format(frontier.expanded()))
+            try:
+                t.crawl_graph(seeds, entry_handler, frontier, args.crawl_hops, args.crawl_direction, args.crawl_hop_limit, args.ids)
+            except KeyboardInterrupt:
+                interrupted = True
+            frontier.close()
+        t.profiles.close()
+        if limiter is not None:
+            limiter.close()
+
+        if t.stream_metrics is not None:
+            stats = t.stream_metrics.stats()
+            print('\nstream queue: {} processed, max depth {}, waited {:.3f}s on average ({:.3f}s max), processed in {:.3f}s on average ({:.3f}s max)'.format(
+                stats['processed'], stats['max_depth'], stats['queue_avg'], stats['queue_max'], stats['process_avg'], stats['process_max']))
+            print('stream notices: {} stall warnings, {} disconnects'.format(stats['stall_warnings'], stats['disconnects']))
+
+        stats = t.retry.stats()
+        if stats['retries'] > 0 or stats['circuits_opened'] > 0:
+            print('\nretries: {} after errors, {:.1f}s lost waiting, {} circuit breakers opened'.format(
+                stats['retries'], stats['time_lost'], stats['circuits_opened']))
+
+        if pipeline is not None:
+            # store the results still waiting in the queue
+            pipeline.close()
+            stats = pipeline.stats()
+            print('writer queue: {} stored, {} dropped, max depth {}'.format(stats['processed'], stats['dropped'], stats['max_depth']))
+
+        if state is not None and interrupted and state.get('cursors'):
+            state.checkpoint(force=True)
+            print('run again with --resume to continue from here')
 
     if args.telegram:
         if args.config:
@@ -383,17 +838,41 @@ def main(cwd=None):
                 res = t.parse_channel_links(res)
             filename = args.channel_messages.replace(' ', '_')
         for entry in res:
-            store_result(args.output, entry, args.csv, args.jsonl, filename, start_time)
+            store_result(args.output, entry, output_format, filename, start_time)
+
+    # write the results still buffered before reporting the created files
+    close_writers()
+    close_tables()
+    close_databases()
+    save_dedup()
+    if state is not None and not (interrupted and state.get('cursors')):
+        # only runs stopped with cursors left keep their state to be resumed
+        state.remove()
 
     if number_of_results == 0:
         print('No results')
         return
 
+    if args.sqlite:
+        print('[+] stored in {}'.format(os.path.join(args.output, DATABASE_NAME)))
+        return
+
     files = glob.glob(f'{args.output}/*{start_time}*')
     for filename in files:
         print('[+] created {}'.format(filename))
 
 
+def parse_amount(value, units):
+    '''
+    parses amounts like 5h or 100M, units maps each suffix to its multiplier
+    returns None if the format is invalid
+    '''
+    match = re.search(r'^(\d+)(\D?)$', value)
+    if match is None or match.group(2) not in units:
+        return None
+    return int(match.group(1)) * units[match.group(2)]
+
+
 def search_dict(res_dict, query_value):
     filtered_dict = []
     for r in res_dict:
@@ -415,46 +894,28 @@ def getpath(nested_dict, value, prepath=()):
 
 
 def delete_unsued_keys(entry):
+    '''
+    returns a copy of entry without the unused keys, the dicts of an entry can
+    be shared with other entries handled in other threads so they are not changed
+    '''
     unused_keys = ['id_str', 'profile_background_color', 'profile_link_color', 'profile_sidebar_border_color', 'profile_sidebar_fill_color', 'profile_text_color', 'favorited', 'filter_level']
-    dict_keys = []
-    keys_to_delete = []
-    for key in entry:
-        if key in unused_keys:
-            keys_to_delete.append(key)
-        elif type(entry[key]) == dict:
-            dict_keys.append(key)
-    for k in keys_to_delete:
-        del entry[k]
-    for k in dict_keys:
-        delete_unsued_keys(entry[k])
-
-
-def standarize_entry(obj, entry):
+    return {key: delete_unsued_keys(value) if type(value) == dict else value for key, value in entry.items() if key not in unused_keys}
+
+
+def standarize_entry(obj, entry, timestamp=None):
     '''
     remove unused entrys and add important fields
     a unique id 'og_id', a search id 'og_search_id'
     a timestamp 'og_timestamp' and a type 'og_type'
     '''
 
-    delete_unsued_keys(entry)
+    entry = delete_unsued_keys(entry)
     entry['og_id'] = str(uuid.uuid4())
     entry['og_search_id'] = obj.search_id
-    entry['og_timestamp'] = int(time.time())
+    entry['og_timestamp'] = timestamp or int(time.time())
     entry['og_type'] = obj.type
     return entry
 
 
-# some functions to parse json date
-class DateTimeEncoder(json.JSONEncoder):
-    def default(self, o):
-        if isinstance(o, datetime):
-            return o.isoformat()
-
-        if isinstance(o, bytes):
-            return list(o)
-
-        return json.JSONEncoder.default(self, o)
-
-
 if __name__ == "__main__":
     main()
@@ -0,0 +1,113 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import sqlite3
+import hashlib
+import threading
+
+PRIORITIES = ['followers', 'degree', 'fifo']
+DIRECTIONS = ['followers', 'friends', 'both']
+
+# neighbors found while a user is expanded are added to the frontier in batches
+DISCOVER_BATCH_SIZE = 10000
+
+
+class Frontier:
+    '''
+    users waiting to be expanded and users already expanded by a multi-hop
+    crawl, kept as integer ids in a sqlite database so the crawl is not
+    bounded by memory and resumes where it stopped
+
+    the next user of a hop is the one with the highest score, its followers
+    count, the number of crawled users related to it or its discovery order
+    '''
+
+    def __init__(self, path, priority='followers'):
+        if priority not in PRIORITIES:
+            raise Exception(f'unknown crawl priority \'{priority}\'')
+        self.path = path
+        self.priority = priority
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS frontier (user_id INTEGER PRIMARY KEY, hop INTEGER NOT NULL, score REAL NOT NULL, claimed INTEGER NOT NULL DEFAULT 0) WITHOUT ROWID')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS frontier_next ON frontier (hop, claimed, score)')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS visited (user_id INTEGER PRIMARY KEY, hop INTEGER NOT NULL) WITHOUT ROWID')
+        # users claimed when the previous run stopped were not fully expanded
+        self.connection.execute('UPDATE frontier SET claimed = 0 WHERE claimed = 1')
+        # fifo scores decrease so the first users discovered are the first expanded
+        self.next_order = self.connection.execute('SELECT COALESCE(MIN(score), 0) - 1 FROM frontier').fetchone()[0]
+
+    def discover(self, users, hop):
+        '''adds (user id, followers count) pairs to a hop, unless they were already expanded'''
+        if self.priority == 'degree':
+            conflict = 'DO UPDATE SET score = score + 1'
+        else:
+            conflict = 'DO NOTHING'
+        statement = (
+            'INSERT INTO frontier (user_id, hop, score) SELECT ?, ?, ? '
+            'WHERE NOT EXISTS (SELECT 1 FROM visited WHERE user_id = ?) '
+            f'ON CONFLICT(user_id) {conflict}'
+        )
+        with self.lock:
+            rows = []
+            for user_id, followers_count in users:
+                rows.append((user_id, hop, self.__score(followers_count), user_id))
+            self.connection.execute('BEGIN')
+            self.connection.executemany(statement, rows)
+            self.connection.execute('COMMIT')
+
+    def __score(self, followers_count):
+        if self.priority == 'followers':
+            return followers_count or 0
+        if self.priority == 'degree':
+            return 1
+        self.next_order -= 1
+        return self.next_order
+
+    def claim(self, hop):
+        '''returns the next user of a hop to expand, None if there are none left'''
+        with self.lock:
+            row = self.connection.execute('SELECT user_id FROM frontier WHERE hop = ? AND claimed = 0 ORDER BY score DESC LIMIT 1', (hop,)).fetchone()
+            if row is None:
+                return None
+            self.connection.execute('UPDATE frontier SET claimed = 1 WHERE user_id = ?', (row[0],))
+            return row[0]
+
+    def done(self, user_id, hop):
+        '''moves an expanded user from the frontier to the visited users'''
+        with self.lock:
+            self.connection.execute('BEGIN')
+            self.connection.execute('DELETE FROM frontier WHERE user_id = ?', (user_id,))
+            self.connection.execute('INSERT OR IGNORE INTO visited (user_id, hop) VALUES (?, ?)', (user_id, hop))
+            self.connection.execute('COMMIT')
+
+    def expanded(self, hop=None):
+        '''returns the number of users expanded, in a hop or in total'''
+        with self.lock:
+            if hop is None:
+                return self.connection.execute('SELECT COUNT(*) FROM visited').fetchone()[0]
+            return self.connection.execute('SELECT COUNT(*) FROM visited WHERE hop = ?', (hop,)).fetchone()[0]
+
+    def pending(self, hop):
+        '''returns the number of users of a hop waiting to be expanded'''
+        with self.lock:
+            return self.connection.execute('SELECT COUNT(*) FROM frontier WHERE hop = ?', (hop,)).fetchone()[0]
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+def build_frontier_path(persistent_dir, seeds, hops, direction, priority):
+    '''
+    returns the database of a crawl, running the same crawl
+    again resumes it instead of starting from the seeds
+    '''
+    crawl = '{}:{}:{}:{}'.format(' '.join(sorted(seeds)), hops, direction, priority)
+    crawl_hash = hashlib.sha1(crawl.encode('utf-8')).hexdigest()[:16]
+    crawl_dir = os.path.join(persistent_dir, 'crawl')
+    os.makedirs(crawl_dir, 0o700, True)
+    return os.path.join(crawl_dir, f'{crawl_hash}.db')
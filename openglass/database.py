@@ -0,0 +1,156 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import atexit
+import sqlite3
+import threading
+from datetime import datetime
+
+from .records import entity_type, ENTITY_TABLES, RELATION_TYPES
+
+# rows buffered before they are written to the database in one transaction
+BATCH_SIZE = 5000
+
+# columns of the primary key of each relation table
+RELATION_KEYS = {
+    'follows': ['follower_id', 'followed_id'],
+    'followed': ['followed_id', 'follower_id'],
+    'tweeted': ['user_id', 'tweet_id'],
+    'retweeted': ['t_retweeter_id', 't_retweeted_id'],
+    'replied': ['t_replier_id', 't_replied_id'],
+}
+
+# dates are stored in iso format
+sqlite3.register_adapter(datetime, datetime.isoformat)
+
+# global variables holding the databases opened during the run
+databases = {}
+databases_lock = threading.Lock()
+
+
+def sqlite_type(kind):
+    if kind == 'int' or kind == 'bool':
+        return 'INTEGER'
+    return 'TEXT'
+
+
+class Database:
+    '''
+    stores users, tweets and their relations in a sqlite database,
+    rows are upserted on their ids in batched transactions
+    '''
+
+    def __init__(self, path, batch_size=BATCH_SIZE):
+        self.path = path
+        self.batch_size = batch_size
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.record_types = {}
+        self.statements = {}
+        self.pending = {}
+        self.num_pending = 0
+        for table in ENTITY_TABLES:
+            self.__create_entity_table(table)
+        for table, key in RELATION_KEYS.items():
+            self.__create_relation_table(table, list(RELATION_TYPES[table]._fields), key)
+
+    def __create_entity_table(self, table):
+        self.record_types[table] = entity_type(table, typed=True)
+        attributes = self.record_types[table].attributes
+        names = [a.name for a in attributes]
+        columns = ', '.join(f'{a.name} {sqlite_type(a.kind)}' + (' PRIMARY KEY' if a.name == 'id' else '') for a in attributes)
+        self.connection.execute(f'CREATE TABLE IF NOT EXISTS {table} ({columns})')
+        # databases created before an attribute was added to share/models lack its column
+        existing = [row[1] for row in self.connection.execute(f'PRAGMA table_info({table})')]
+        for a in attributes:
+            if a.name not in existing:
+                self.connection.execute(f'ALTER TABLE {table} ADD COLUMN {a.name} {sqlite_type(a.kind)}')
+        updates = ', '.join(f'{name} = excluded.{name}' for name in names if name != 'id')
+        self.statements[table] = (
+            f'INSERT INTO {table} ({", ".join(names)}) VALUES ({", ".join("?" for _ in names)}) '
+            f'ON CONFLICT(id) DO UPDATE SET {updates}'
+        )
+        self.pending[table] = []
+
+    def __create_relation_table(self, table, columns, key):
+        definition = ', '.join(f'{name} INTEGER NOT NULL' for name in columns)
+        self.connection.execute(f'CREATE TABLE IF NOT EXISTS {table} ({definition}, PRIMARY KEY ({", ".join(key)})) WITHOUT ROWID')
+        # the primary key allows lookups by its first id, this index by the second
+        self.connection.execute(f'CREATE INDEX IF NOT EXISTS {table}_{key[1]} ON {table} ({key[1]})')
+        values = ', '.join('?' for _ in columns)
+        extra = [name for name in columns if name not in key]
+        if extra:
+            conflict = 'DO UPDATE SET ' + ', '.join(f'{name} = excluded.{name}' for name in extra)
+        else:
+            conflict = 'DO NOTHING'
+        self.statements[table] = (
+            f'INSERT INTO {table} ({", ".join(columns)}) VALUES ({values}) '
+            f'ON CONFLICT({", ".join(key)}) {conflict}'
+        )
+        self.pending[table] = []
+
+    def add(self, table, row):
+        '''buffers a row, row is the json of an entity or the record of a relation'''
+        if table in self.record_types:
+            row = self.record_types[table].from_json(row)
+        with self.lock:
+            self.pending[table].append(row)
+            self.num_pending += 1
+            if self.num_pending >= self.batch_size:
+                self.__commit()
+
+    def commit(self):
+        with self.lock:
+            self.__commit()
+
+    def close(self):
+        with self.lock:
+            self.__commit()
+            self.connection.close()
+
+    def __commit(self):
+        if self.num_pending == 0:
+            return
+        self.connection.execute('BEGIN')
+        try:
+            for table, rows in self.pending.items():
+                if rows:
+                    self.connection.executemany(self.statements[table], rows)
+            self.connection.execute('COMMIT')
+        except Exception:
+            self.connection.execute('ROLLBACK')
+            raise
+        for rows in self.pending.values():
+            rows.clear()
+        self.num_pending = 0
+
+
+def open_database(path):
+    '''returns the database stored in path, opening it the first time it is used'''
+    database = databases.get(path)
+    if database is not None:
+        return database
+    with databases_lock:
+        if path not in databases:
+            databases[path] = Database(path)
+        return databases[path]
+
+
+def commit_databases():
+    '''writes the buffered rows of every database'''
+    with databases_lock:
+        for database in databases.values():
+            database.commit()
+
+
+def close_databases():
+    '''commits the buffered rows and closes the databases'''
+    with databases_lock:
+        for database in databases.values():
+            database.close()
+        databases.clear()
+
+
+atexit.register(close_databases)
@@ -0,0 +1,298 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import math
+import struct
+import heapq
+import hashlib
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+
+
+# the pages of a bloom filter written again when one of their bits is set
+PAGE_SIZE = 4096
+
+# new keys of an exact set kept in a hash set before they are sorted into a run
+EXACT_BUFFER_SIZE = 65536
+
+# keys of an exact set sorted at once when it is loaded
+LOAD_CHUNK_SIZE = 1000000
+
+WORD_MASK = (1 << 64) - 1
+
+# multiplier spreading the keys over the bits of the hint of an exact set (fibonacci hashing)
+HINT_MULTIPLIER = 0x9E3779B97F4A7C15
+
+
+class ExactSet:
+    '''
+    exact set of integer keys packed in sorted arrays of 64 bit words, one word
+    per key for ids and two for pairs of ids, so a key takes key_size bytes
+
+    new keys wait in a small hash set until there are buffer_size of them, then
+    they are sorted into a run, and runs of the same size are merged so there
+    are only a few of them to search, a hint with a bit per 8 bits of keys
+    skips the search for most keys that are not in the set
+
+    keys are stored on disk as key_size bytes, each save appends the keys added
+    since the last one
+    '''
+
+    kind = 'exact'
+
+    def __init__(self, key_size=8, buffer_size=EXACT_BUFFER_SIZE):
+        self.key_size = key_size
+        self.buffer_size = buffer_size
+        self.recent = set()
+        # sorted runs, largest first, each a tuple with an array per 64 bit word of the keys
+        self.runs = []
+        self.count = 0
+        self.unsaved = bytearray()
+        self.hint_bits = 16
+        self.hint = bytearray(1 << (self.hint_bits - 3))
+
+    def add(self, key):
+        '''adds a key and returns True if it was not in the set'''
+        if key in self:
+            return False
+        self.recent.add(key)
+        self.unsaved += key.to_bytes(self.key_size, 'little')
+        self.count += 1
+        self.__mark(key)
+        if self.count > len(self.hint):
+            self.__grow_hint()
+        if len(self.recent) >= self.buffer_size:
+            self.__add_run(sorted(self.recent))
+            self.recent = set()
+        return True
+
+    def __contains__(self, key):
+        if key in self.recent:
+            return True
+        position = self.__hint_position(key)
+        if not self.hint[position >> 3] & (1 << (position & 7)):
+            return False
+        for run in self.runs:
+            if self.__search(run, key):
+                return True
+        return False
+
+    def __len__(self):
+        return self.count
+
+    def __hint_position(self, key):
+        word = (key ^ (key >> 64)) & WORD_MASK
+        return ((word * HINT_MULTIPLIER) & WORD_MASK) >> (64 - self.hint_bits)
+
+    def __mark(self, key):
+        position = self.__hint_position(key)
+        self.hint[position >> 3] |= 1 << (position & 7)
+
+    def __grow_hint(self):
+        '''doubles the hint once there are more keys than bytes in it'''
+        while self.count > 1 << (self.hint_bits - 3):
+            self.hint_bits += 1
+        self.hint = bytearray(1 << (self.hint_bits - 3))
+        for key in self.recent:
+            self.__mark(key)
+        for run in self.runs:
+            if self.key_size == 8:
+                keys = run[0]
+            else:
+                keys = ((word << 64) | second for word, second in zip(*run))
+            for key in keys:
+                self.__mark(key)
+
+    def __search(self, run, key):
+        if self.key_size == 8:
+            keys = run[0]
+            i = bisect_left(keys, key)
+            return i < len(keys) and keys[i] == key
+        high, low = run
+        word = key >> 64
+        start = bisect_left(high, word)
+        end = bisect_right(high, word, start)
+        # the pairs with the same first id are sorted by the second one
+        i = bisect_left(low, key & WORD_MASK, start, end)
+        return i < end and low[i] == key & WORD_MASK
+
+    def __add_run(self, keys):
+        '''adds a run with a sorted list of keys, merging the runs that are not larger than it'''
+        if self.key_size == 8:
+            run = (array('Q', keys),)
+        else:
+            run = (array('Q', (key >> 64 for key in keys)), array('Q', (key & WORD_MASK for key in keys)))
+        self.runs.append(run)
+        while len(self.runs) > 1 and len(self.runs[-2][0]) <= len(self.runs[-1][0]):
+            newer = self.runs.pop()
+            older = self.runs.pop()
+            self.runs.append(self.__merge(older, newer))
+
+    def __merge(self, a, b):
+        if self.key_size == 8:
+            return (array('Q', heapq.merge(a[0], b[0])),)
+        high = array('Q')
+        low = array('Q')
+        for word, second in heapq.merge(zip(*a), zip(*b)):
+            high.append(word)
+            low.append(second)
+        return (high, low)
+
+    def save(self, path):
+        with open(path, 'ab') as f:
+            f.write(self.unsaved)
+        self.unsaved = bytearray()
+
+    def load(self, path):
+        size = self.key_size
+        with open(path, 'rb') as f:
+            data = f.read()
+        if len(data) % size != 0:
+            # a save was interrupted, its last key is incomplete
+            data = data[:len(data) - len(data) % size]
+            os.truncate(path, len(data))
+        # the keys are sorted in chunks so loading does not hold them all as python ints
+        chunk = LOAD_CHUNK_SIZE * size
+        for offset in range(0, len(data), chunk):
+            part = data[offset:offset + chunk]
+            if size == 8:
+                keys = array('Q')
+                keys.frombytes(part)
+            else:
+                keys = [int.from_bytes(part[i:i + size], 'little') for i in range(0, len(part), size)]
+            self.__add_run(sorted(keys))
+            self.count += len(keys)
+        self.__grow_hint()
+
+
+class BloomFilter:
+    '''
+    bloom filter of integer keys, its memory is fixed by the capacity and
+    the false positive rate, a false positive means skipping a new key
+    '''
+
+    kind = 'bloom'
+
+    def __init__(self, capacity, error_rate):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.num_bits = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+        # pages with bits set since the last save, None if the whole file has to be written
+        self.dirty = None
+
+    def __positions(self, key):
+        digest = hashlib.blake2b(key.to_bytes(16, 'little'), digest_size=16).digest()
+        h1, h2 = struct.unpack('<QQ', digest)
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def add(self, key):
+        '''adds a key and returns True if it was (probably) not in the filter'''
+        new = False
+        for position in self.__positions(key):
+            byte, bit = divmod(position, 8)
+            if not self.bits[byte] & (1 << bit):
+                self.bits[byte] |= 1 << bit
+                new = True
+                if self.dirty is not None:
+                    self.dirty.add(byte // PAGE_SIZE)
+        if new:
+            self.count += 1
+        return new
+
+    def __contains__(self, key):
+        for position in self.__positions(key):
+            byte, bit = divmod(position, 8)
+            if not self.bits[byte] & (1 << bit):
+                return False
+        return True
+
+    def __len__(self):
+        return self.count
+
+    def save(self, path):
+        '''writes the header and the pages that changed since the last save'''
+        header = struct.pack('<QQQ', self.num_bits, self.num_hashes, self.count)
+        if self.dirty is None:
+            tmp_path = f'{path}.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(header)
+                f.write(self.bits)
+            os.replace(tmp_path, path)
+        else:
+            # bits are only ever set, a page written halfway still holds the bits of the last save
+            with open(path, 'r+b') as f:
+                for page in sorted(self.dirty):
+                    f.seek(len(header) + page * PAGE_SIZE)
+                    f.write(self.bits[page * PAGE_SIZE:(page + 1) * PAGE_SIZE])
+                f.seek(0)
+                f.write(header)
+        self.dirty = set()
+
+    def load(self, path):
+        with open(path, 'rb') as f:
+            num_bits, num_hashes, count = struct.unpack('<QQQ', f.read(24))
+            if num_bits != self.num_bits or num_hashes != self.num_hashes:
+                # the filter was created with another capacity or error rate, the file is replaced
+                return
+            bits = bytearray(f.read())
+        if len(bits) != len(self.bits):
+            return
+        self.bits = bits
+        self.count = count
+        self.dirty = set()
+
+
+class DedupStore:
+    '''
+    remembers which entities were already written so they are only written once,
+    optionally persisted to disk so later runs skip them as well
+    '''
+
+    def __init__(self, mode='exact', capacity=10000000, error_rate=0.001, path=None, key_size=8):
+        if mode == 'exact':
+            self.keys = ExactSet(key_size)
+        elif mode == 'bloom':
+            self.keys = BloomFilter(capacity, error_rate)
+        else:
+            raise Exception(f'unknown dedup mode \'{mode}\'')
+        self.path = path
+        self.lock = threading.Lock()
+        if self.path is not None and os.path.isfile(self.path):
+            self.keys.load(self.path)
+
+    def add(self, key):
+        '''returns True the first time a key is seen'''
+        with self.lock:
+            return self.keys.add(int(key))
+
+    def __contains__(self, key):
+        with self.lock:
+            return int(key) in self.keys
+
+    def __len__(self):
+        return len(self.keys)
+
+    def save(self):
+        '''persists the keys added since the last save, if the store has a path'''
+        if self.path is None:
+            return
+        with self.lock:
+            self.keys.save(self.path)
+
+
+def edge_key(src, dst):
+    '''packs the two 64 bit ids of a relation into one key'''
+    return (int(src) << 64) | int(dst)
+
+
+def build_dedup_dir(persistent_dir, output_dir):
+    '''returns the folder holding the dedup stores of an output directory'''
+    output_hash = hashlib.sha1(os.path.abspath(output_dir).encode('utf-8')).hexdigest()[:16]
+    dedup_dir = os.path.join(persistent_dir, 'dedup', output_hash)
+    os.makedirs(dedup_dir, 0o700, True)
+    return dedup_dir
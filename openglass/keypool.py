@@ -0,0 +1,111 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import time
+import sqlite3
+import threading
+
+from .ratelimit import WINDOW, DEFAULT_REQUESTS_PER_WINDOW, RESET_MARGIN, parse_headers
+
+# seconds a process waits for another one to release the database
+LOCK_TIMEOUT = 30
+
+
+class KeyPool:
+    '''
+    rate limiter shared by the openglass processes of a host, the budget of
+    each key on each endpoint is kept in a sqlite database instead of memory
+
+    every request leases one request of the window of the key with the most
+    left, in a transaction that locks the database, so processes sharing
+    keys never count on the same requests, and the rate limit headers of
+    each response update the budget for all of them
+
+    keys are identified by key_id, their secrets are never stored
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, timeout=LOCK_TIMEOUT, isolation_level=None, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS limits (endpoint TEXT PRIMARY KEY, requests INTEGER NOT NULL) WITHOUT ROWID')
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS budgets (key TEXT NOT NULL, endpoint TEXT NOT NULL, requests INTEGER NOT NULL, '
+            'remaining INTEGER NOT NULL, reset REAL NOT NULL, PRIMARY KEY (key, endpoint)) WITHOUT ROWID'
+        )
+
+    def declare(self, endpoint, requests_per_window):
+        '''sets the requests per window of an endpoint, used until twitter reports it'''
+        with self.lock:
+            self.connection.execute('INSERT OR IGNORE INTO limits (endpoint, requests) VALUES (?, ?)', (endpoint, requests_per_window))
+
+    def acquire(self, endpoint, keys):
+        '''leases a request on the key with the most headroom and returns the key'''
+        if len(keys) == 0:
+            raise Exception('there are no api keys left')
+        while True:
+            with self.lock:
+                self.connection.execute('BEGIN IMMEDIATE')
+                try:
+                    now = time.time()
+                    budgets = [self.__budget(key, endpoint, now) + (key,) for key in keys]
+                    remaining, _, key = max(budgets, key=lambda b: b[0])
+                    if remaining > 0:
+                        self.connection.execute('UPDATE budgets SET remaining = remaining - 1 WHERE key = ? AND endpoint = ?', (key, endpoint))
+                        return key
+                    wait = min(reset for _, reset, _ in budgets) - now
+                finally:
+                    self.connection.execute('COMMIT')
+            time.sleep(max(0, wait) + RESET_MARGIN)
+
+    def update(self, key, endpoint, headers):
+        '''updates the budget of a key with the rate limit headers of a response'''
+        limit, remaining, reset = parse_headers(headers)
+        if remaining is None or reset is None:
+            return
+        with self.lock:
+            self.connection.execute('BEGIN IMMEDIATE')
+            try:
+                current_remaining, current_reset = self.__budget(key, endpoint, time.time())
+                if limit is not None:
+                    self.connection.execute('INSERT OR REPLACE INTO limits (endpoint, requests) VALUES (?, ?)', (endpoint, limit))
+                    self.connection.execute('UPDATE budgets SET requests = ? WHERE key = ? AND endpoint = ?', (limit, key, endpoint))
+                # requests leased after this one was sent, by any process, are not counted in its headers
+                if reset == current_reset:
+                    remaining = min(remaining, current_remaining)
+                self.connection.execute('UPDATE budgets SET remaining = ?, reset = ? WHERE key = ? AND endpoint = ?', (remaining, reset, key, endpoint))
+            finally:
+                self.connection.execute('COMMIT')
+
+    def exhausted(self, key, endpoint, headers=None):
+        '''marks a key as exhausted on an endpoint, after twitter answered with a 429'''
+        reset = None
+        if headers is not None:
+            _, _, reset = parse_headers(headers)
+        with self.lock:
+            self.connection.execute('BEGIN IMMEDIATE')
+            try:
+                self.__budget(key, endpoint, time.time())
+                self.connection.execute('UPDATE budgets SET remaining = 0 WHERE key = ? AND endpoint = ?', (key, endpoint))
+                if reset is not None:
+                    self.connection.execute('UPDATE budgets SET reset = ? WHERE key = ? AND endpoint = ?', (reset, key, endpoint))
+            finally:
+                self.connection.execute('COMMIT')
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+    def __budget(self, key, endpoint, now):
+        '''returns the remaining requests and reset time of a key, starting a new window if the last one is over'''
+        row = self.connection.execute('SELECT remaining, reset FROM budgets WHERE key = ? AND endpoint = ?', (key, endpoint)).fetchone()
+        if row is not None and now < row[1]:
+            return row
+        limit = self.connection.execute('SELECT requests FROM limits WHERE endpoint = ?', (endpoint,)).fetchone()
+        limit = limit[0] if limit is not None else DEFAULT_REQUESTS_PER_WINDOW
+        self.connection.execute(
+            'INSERT OR REPLACE INTO budgets (key, endpoint, requests, remaining, reset) VALUES (?, ?, ?, ?, ?)',
+            (key, endpoint, limit, limit, now + WINDOW)
+        )
+        return (limit, now + WINDOW)
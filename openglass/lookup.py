@@ -0,0 +1,255 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import re
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+
+from .serialize import dumps, loads
+
+# the lookup endpoints of twitter take up to 100 ids per request
+BATCH_SIZE = 100
+
+# seconds an id waits for more ids to fill its batch before it is looked up anyway
+BATCH_DELAY = 2
+
+# profiles are looked up again once they are older than this many seconds
+PROFILE_TTL = 24 * 60 * 60
+
+
+class LRUCache:
+    '''dict keeping the max_size most recently used entries'''
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self.lock:
+            if key not in self.entries:
+                return default
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            if len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def __contains__(self, key):
+        with self.lock:
+            return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class BatchResolver:
+    '''
+    resolves ids to objects with a lookup function taking a list of ids,
+    the ids are collected by a background thread and looked up together
+    once batch_size of them are waiting or the oldest waited max_delay seconds
+
+    objects already in the cache are resolved at once, the callbacks of the
+    rest run in the background thread, with None for ids that were not found,
+    and an error raised by them is raised again by the next resolve call
+    '''
+
+    def __init__(self, lookup, cache_size, batch_size=BATCH_SIZE, max_delay=BATCH_DELAY, name='resolver'):
+        self.lookup = lookup
+        self.cache = LRUCache(cache_size)
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+        self.pending = OrderedDict()
+        self.oldest = None
+        self.closed = False
+        self.error = None
+        self.lookups = 0
+        self.hits = 0
+        self.thread = threading.Thread(target=self.__work, name=name, daemon=True)
+        self.thread.start()
+
+    def add(self, key, value):
+        '''caches an object obtained elsewhere'''
+        self.cache.put(key, value)
+
+    def resolve(self, key, callback):
+        '''calls callback with the object of key, now if it is cached or later from the background thread'''
+        self.check()
+        value = self.cache.get(key)
+        if value is not None:
+            self.hits += 1
+            callback(value)
+            return
+        with self.lock:
+            if not self.pending:
+                self.oldest = time.time()
+            # requests of the same id share a lookup
+            self.pending.setdefault(key, []).append(callback)
+            self.changed.notify()
+
+    def check(self):
+        '''raises the error of a callback run in the background thread, if there was one'''
+        if self.error is not None:
+            error = self.error
+            self.error = None
+            raise error
+
+    def close(self):
+        '''resolves the pending ids and stops the background thread'''
+        with self.lock:
+            self.closed = True
+            self.changed.notify()
+        self.thread.join()
+        self.check()
+
+    def __next_batch(self):
+        with self.lock:
+            while True:
+                if self.pending and (self.closed or len(self.pending) >= self.batch_size or time.time() - self.oldest >= self.max_delay):
+                    break
+                if self.closed:
+                    return None
+                timeout = None
+                if self.pending:
+                    timeout = self.max_delay - (time.time() - self.oldest)
+                self.changed.wait(timeout)
+            keys = list(self.pending)[:self.batch_size]
+            batch = [(key, self.pending.pop(key)) for key in keys]
+            self.oldest = time.time() if self.pending else None
+            return batch
+
+    def __work(self):
+        while True:
+            batch = self.__next_batch()
+            if batch is None:
+                return
+            try:
+                self.lookups += 1
+                values = self.lookup([key for key, _ in batch])
+                for key, callbacks in batch:
+                    value = values.get(key)
+                    if value is not None:
+                        self.cache.put(key, value)
+                    for callback in callbacks:
+                        callback(value)
+            except BaseException as e:
+                # the error reaches the thread calling resolve
+                self.error = e
+
+
+class ProfileCache:
+    '''
+    profiles of users by id and by screen name, kept in memory and, if it
+    has a path, in a sqlite database reused by later runs, until they are
+    older than ttl seconds
+
+    users missing from the cache are looked up together, 100 per request
+    '''
+
+    def __init__(self, path=None, ttl=PROFILE_TTL):
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        # user id: (time looked up, profile)
+        self.profiles = {}
+        # lowercase screen name: user id
+        self.names = {}
+        self.connection = None
+        if path is not None:
+            self.connection = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS profiles (user_id INTEGER PRIMARY KEY, screen_name TEXT NOT NULL, fetched REAL NOT NULL, profile BLOB NOT NULL) WITHOUT ROWID')
+            self.connection.execute('CREATE INDEX IF NOT EXISTS profiles_screen_name ON profiles (screen_name)')
+            self.connection.execute('DELETE FROM profiles WHERE fetched < ?', (time.time() - ttl,))
+
+    def get(self, user):
+        '''returns the cached profile of a user id or screen name, None if it is missing or expired'''
+        with self.lock:
+            if is_user_id(user):
+                user_id = int(user)
+            else:
+                user_id = self.names.get(user.lower())
+            entry = self.profiles.get(user_id)
+            if entry is None and self.connection is not None:
+                entry = self.__load(user)
+            if entry is None or time.time() - entry[0] > self.ttl:
+                return None
+            return entry[1]
+
+    def __load(self, user):
+        if is_user_id(user):
+            row = self.connection.execute('SELECT fetched, profile FROM profiles WHERE user_id = ?', (int(user),)).fetchone()
+        else:
+            row = self.connection.execute('SELECT fetched, profile FROM profiles WHERE screen_name = ?', (user.lower(),)).fetchone()
+        if row is None:
+            return None
+        entry = (row[0], loads(row[1]))
+        self.profiles[entry[1]['id']] = entry
+        self.names[entry[1]['screen_name'].lower()] = entry[1]['id']
+        return entry
+
+    def put(self, profiles):
+        '''caches profiles that were just looked up'''
+        now = time.time()
+        with self.lock:
+            for profile in profiles:
+                self.profiles[profile['id']] = (now, profile)
+                self.names[profile['screen_name'].lower()] = profile['id']
+            if self.connection is not None and len(profiles) > 0:
+                rows = [(profile['id'], profile['screen_name'].lower(), now, dumps(profile)) for profile in profiles]
+                self.connection.execute('BEGIN')
+                self.connection.executemany('INSERT OR REPLACE INTO profiles (user_id, screen_name, fetched, profile) VALUES (?, ?, ?, ?)', rows)
+                self.connection.execute('COMMIT')
+
+    def resolve(self, users, lookup_users):
+        '''
+        returns a dict with the profiles of a list of user ids and screen names,
+        the ones not cached are looked up with lookup_users, users that do not
+        exist are left out
+        '''
+        profiles = {}
+        user_ids = []
+        screen_names = []
+        for user in users:
+            profile = self.get(user)
+            if profile is not None:
+                profiles[user] = profile
+            elif is_user_id(user):
+                user_ids.append(user)
+            else:
+                screen_names.append(user)
+
+        found = []
+        if len(user_ids) > 0:
+            found += lookup_users(user_ids=list(dict.fromkeys(user_ids)))
+        if len(screen_names) > 0:
+            found += lookup_users(screen_names=list(dict.fromkeys(screen_names)))
+        self.put(found)
+
+        by_id = {profile['id']: profile for profile in found}
+        by_name = {profile['screen_name'].lower(): profile for profile in found}
+        for user in user_ids:
+            if int(user) in by_id:
+                profiles[user] = by_id[int(user)]
+        for user in screen_names:
+            if user.lower() in by_name:
+                profiles[user] = by_name[user.lower()]
+        return profiles
+
+    def close(self):
+        with self.lock:
+            if self.connection is not None:
+                self.connection.close()
+                self.connection = None
+
+
+def is_user_id(user):
+    '''users given only with digits are ids, the rest screen names'''
+    return isinstance(user, int) or re.search(r'^\d+$', user) is not None
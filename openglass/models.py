@@ -0,0 +1,144 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+from datetime import datetime
+
+import yaml
+
+from .serialize import dumps
+
+# share/models holds a description of the attributes of each twitter entity, it is installed with the package
+MODELS_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'share', 'models')
+
+# attributes whose type can not be told from their name or description
+ATTRIBUTE_KINDS = {
+    'id': 'int',
+    'utc_offset': 'int',
+    'created_at': 'datetime',
+    'coordinates': 'json',
+    'geo': 'json',
+    'place': 'json',
+}
+
+# keys of the yml files that describe an attribute instead of naming a nested one
+META_KEYS = ['description', 'multiple', 'field']
+
+models = {}
+
+
+class Attribute:
+    '''an attribute of a model, found in the entries under the keys of its path'''
+
+    def __init__(self, path, kind):
+        self.path = path
+        self.name = '_'.join(path)
+        self.kind = kind
+
+
+def attribute_kind(name, description):
+    if name in ATTRIBUTE_KINDS:
+        return ATTRIBUTE_KINDS[name]
+    if name.endswith('_count') or name.endswith('_id'):
+        return 'int'
+    if isinstance(description, str) and description.startswith('true or false'):
+        return 'bool'
+    return 'str'
+
+
+def parse_attributes(attributes, prefix=()):
+    '''flattens the attributes of a yml model, nested attributes are joined with _'''
+    parsed = []
+    for key, value in attributes.items():
+        if isinstance(value, dict) and 'description' not in value:
+            # a group of attributes, like entities
+            field = value.get('field', key)
+            nested = {k: v for k, v in value.items() if k not in META_KEYS}
+            parsed += parse_attributes(nested, prefix + (field,))
+            continue
+        if isinstance(value, dict):
+            field = value.get('field', key)
+            kind = 'json' if value.get('multiple') else attribute_kind(field, value['description'])
+        else:
+            field = key
+            kind = attribute_kind(field, value)
+        parsed.append(Attribute(prefix + (field,), kind))
+    return parsed
+
+
+def load_model(name):
+    '''returns the attributes of a model in share/models, like tweet or twitter_user'''
+    if name not in models:
+        with open(os.path.join(MODELS_DIR, f'{name}.yml')) as f:
+            model = yaml.safe_load(f)
+        models[name] = parse_attributes(model['attributes'])
+    return models[name]
+
+
+def select_attributes(model, columns=None):
+    '''returns the attributes of a model named in columns, all of them if columns is None'''
+    attributes = load_model(model)
+    if columns is None:
+        return attributes
+    by_name = {attribute.name: attribute for attribute in attributes}
+    unknown = [column for column in columns if column not in by_name]
+    if unknown:
+        raise Exception('unknown {} attributes: {}, available: {}'.format(model, ', '.join(unknown), ', '.join(by_name)))
+    return [by_name[column] for column in columns]
+
+
+def to_int(value):
+    return None if value is None else int(value)
+
+
+def to_bool(value):
+    return None if value is None else bool(value)
+
+
+def to_datetime(value):
+    return None if value is None else datetime.strptime(value, '%a %b %d %H:%M:%S %z %Y')
+
+
+def to_json(value):
+    return None if value is None else dumps(value).decode('utf-8')
+
+
+def to_text(value):
+    '''strings are kept, objects like coordinates are encoded as json'''
+    if value is None or isinstance(value, str):
+        return value
+    return dumps(value).decode('utf-8')
+
+
+# conversion applied to each kind of attribute by typed encoders
+TYPED_CONVERSIONS = {'int': 'to_int', 'bool': 'to_bool', 'datetime': 'to_datetime', 'json': 'to_json', 'str': 'to_text'}
+
+# conversion applied by text encoders, other values are kept as found in the json
+TEXT_CONVERSIONS = {'json': 'to_json', 'str': 'to_text'}
+
+
+def compile_encoder(attributes, typed=False, factory=None):
+    '''
+    generates a function that takes the json of an entity and returns the
+    values of the attributes, converted to their kind if typed is True,
+    as a list or as the arguments of factory
+    '''
+    conversions = TYPED_CONVERSIONS if typed else TEXT_CONVERSIONS
+    values = []
+    for attribute in attributes:
+        value = 'entry'
+        for key in attribute.path[:-1]:
+            value = f'({value}.get({key!r}) or {{}})'
+        value = f'{value}.get({attribute.path[-1]!r})'
+        conversion = conversions.get(attribute.kind)
+        if conversion is not None:
+            value = f'{conversion}({value})'
+        values.append(value)
+    if factory is None:
+        source = 'def encode(entry):\n    return [\n        {}\n    ]\n'
+    else:
+        source = 'def encode(entry):\n    return factory(\n        {}\n    )\n'
+    source = source.format(',\n        '.join(values))
+    namespace = {'to_int': to_int, 'to_bool': to_bool, 'to_datetime': to_datetime, 'to_json': to_json, 'to_text': to_text, 'factory': factory}
+    exec(compile(source, '<encoder>', 'exec'), namespace)
+    return namespace['encode']
@@ -2,365 +2,254 @@
 # -*- coding: utf-8 -*-
 
 import os
-import json
+import sys
+from .dedup import DedupStore, edge_key
+from .writers import open_writer
+from .parquet import open_table
+from .database import open_database
+from .serialize import dumps, dumps_pretty
+from .records import entity_type, ENTITY_TABLES, RELATION_TYPES, Follows, Followed, Tweeted, Retweeted, Replied
+
+# the sqlite output collects every run in the same database
+DATABASE_NAME = 'openglass.db'
 
 # global variables used to avoid duplicating entries in the csv files
-users_saved = []
-tweets_saved = []
-
-
-class User:
-    def __init__(self, json_entry):
-        self.header = 'uid,name,screen_name,location,description,protected,followers_count,friends_count,listed_count,statuses_count,created_at,favourites_count,verified,profile_use_background_image,has_extended_profile,default_profile,default_profile_image'
-        self.id = json_entry['id']
-        self.name = json_entry['name'].replace('"', '""')
-        self.screen_name = json_entry['screen_name']
-        self.location = json_entry.get('location', '')
-        self.description = json_entry.get('description', '').replace('"', '""')
-        self.protected = json_entry.get('protected', False)
-        self.followers_count = json_entry.get('followers_count', 0)
-        self.friends_count = json_entry.get('friends_count', 0)
-        self.listed_count = json_entry.get('listed_count', 0)
-        self.statuses_count = json_entry.get('statuses_count', 0)
-        self.created_at = json_entry.get('created_at', None)
-        self.favourites_count = json_entry.get('favorites_count', 0)
-        self.verified = json_entry.get('verified', False)
-        self.profile_use_background_image = json_entry.get('profile_use_background_image', False)
-        self.has_extended_profile = json_entry.get('has_extended_profile', False)
-        self.default_profile = json_entry.get('default_profile', False)
-        self.default_profile_image = json_entry.get('default_profile_image', False)
-
-    def to_entry(self):
-        entry = ''
-        entry += f'{self.id},'
-        entry += f'"{self.name}",'
-        entry += f'{self.screen_name},'
-        entry += f'"{self.location}",'
-        entry += f'"{self.description}",'
-        entry += f'{self.protected},'
-        entry += f'{self.followers_count},'
-        entry += f'{self.friends_count},'
-        entry += f'{self.listed_count},'
-        entry += f'{self.statuses_count},'
-        entry += f'{self.created_at},'
-        entry += f'{self.favourites_count},'
-        entry += f'{self.verified},'
-        entry += f'{self.profile_use_background_image},'
-        entry += f'{self.has_extended_profile},'
-        entry += f'{self.default_profile},'
-        entry += f'{self.default_profile_image}'
-        return entry
-
-    def save_to_file(self, output_dir, filename):
-        global users_saved
-        filename = f'{output_dir}/users_{filename}'
-        if self.id in users_saved:
-            return
-        store_header = not os.path.isfile(filename)
-        fd = os.open(filename, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o660)
-        if store_header:
-            os.write(fd, self.header.encode('utf-8') + b'\n')
-        os.write(fd, self.to_entry().encode('utf-8') + b'\n')
-        os.close(fd)
-        users_saved.append(self.id)
-
-
-class Tweet:
-    def __init__(self, json_entry):
-        self.header ='uid,text,truncated,is_quote_status,retweet_count,favorite_count,possibly_sensitive,lang'
-        self.id = json_entry['id']
-        self.text = json_entry['text'].replace('"', '""')
-        self.truncated = json_entry.get('truncated', False)
-        self.in_reply_to_status_id = json_entry.get('in_reply_to_user_id', None) # this should be a relation
-        self.in_reply_to_user_id = json_entry.get('in_reply_to_user_id', None)  # this should be a relation
-        self.is_quote_status = json_entry.get('is_quote_status', None)
-        self.retweet_count = json_entry.get('retweet_count', None)
-        self.favorite_count = json_entry.get('favorite_count', None)
-        self.possibly_sensitive = json_entry.get('possibly_sensitive', None)
-        self.lang = json_entry.get('lang', None)
-
-    def to_entry(self):
-        entry = ''
-        entry += f'{self.id},'
-        entry += f'"{self.text}",'
-        entry += f'{self.truncated},'
-        entry += f'{self.is_quote_status},'
-        entry += f'{self.retweet_count},'
-        entry += f'{self.favorite_count},'
-        entry += f'{self.possibly_sensitive},'
-        entry += f'{self.lang}'
-        return entry
-
-    def save_to_file(self, output_dir, filename):
-        global tweets_saved
-        filename = f'{output_dir}/tweets_{filename}'
-        if self.id in tweets_saved:
-            return
-        store_header = not os.path.isfile(filename)
-        fd = os.open(filename, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o660)
-        if store_header:
-            os.write(fd, self.header.encode('utf-8') + b'\n')
-        os.write(fd, self.to_entry().encode('utf-8') + b'\n')
-        os.close(fd)
-        tweets_saved.append(self.id)
-
-
-class Follows:
-    def __init__(self, follower_id, followed_id, follower_number):
-        self.header = 'follower_id,followed_id,follower_number'
-        self.follower_id = follower_id
-        self.followed_id = followed_id
-        self.follower_number = follower_number
-
-    def to_entry(self):
-        entry = ''
-        entry += f'{self.follower_id},'
-        entry += f'{self.followed_id},'
-        entry += f'{self.follower_number}'
-        return entry
-
-    def save_to_file(self, output_dir, filename):
-        filename = f'{output_dir}/follows_{filename}'
-        store_header = not os.path.isfile(filename)
-        fd = os.open(filename, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o660)
-        if store_header:
-            os.write(fd, self.header.encode('utf-8') + b'\n')
-        os.write(fd, self.to_entry().encode('utf-8') + b'\n')
-        os.close(fd)
-
-
-class Followed:
-    def __init__(self, followed_id, follower_id):
-        self.header = 'followed_id,follower_id'
-        self.followed_id = followed_id
-        self.follower_id = follower_id
-
-    def to_entry(self):
-        entry = ''
-        entry += f'{self.followed_id},'
-        entry += f'{self.follower_id}'
-        return entry
-
-    def save_to_file(self, output_dir, filename):
-        filename = f'{output_dir}/followed_{filename}'
-        store_header = not os.path.isfile(filename)
-        fd = os.open(filename, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o660)
-        if store_header:
-            os.write(fd, self.header.encode('utf-8') + b'\n')
-        os.write(fd, self.to_entry().encode('utf-8') + b'\n')
-        os.close(fd)
-
-
-class Tweeted:
-    def __init__(self, user_id, tweet_id):
-        self.header = 'user_id,tweet_id'
-        self.user_id = user_id
-        self.tweet_id = tweet_id
-
-    def to_entry(self):
-        entry = ''
-        entry += f'{self.user_id},'
-        entry += f'{self.tweet_id}'
-        return entry
-
-    def save_to_file(self, output_dir, filename):
-        filename = f'{output_dir}/tweeted_{filename}'
-        store_header = not os.path.isfile(filename)
-        fd = os.open(filename, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o660)
-        if store_header:
-            os.write(fd, self.header.encode('utf-8') + b'\n')
-        os.write(fd, self.to_entry().encode('utf-8') + b'\n')
-        os.close(fd)
-
-
-class Retweeted:
-    def __init__(self, t_retweeter_id, t_retweeted_id):
-        self.header = 't_retweeter_id,t_retweeted_id'
-        self.t_retweeter_id = t_retweeted_id
-        self.t_retweeted_id = t_retweeted_id
-
-    def to_entry(self):
-        entry = ''
-        entry += f'{self.t_retweeter_id},'
-        entry += f'{self.t_retweeted_id}'
-        return entry
-
-    def save_to_file(self, output_dir, filename):
-        filename = f'{output_dir}/retweeted_{filename}'
-        store_header = not os.path.isfile(filename)
-        fd = os.open(filename, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o660)
-        if store_header:
-            os.write(fd, self.header.encode('utf-8') + b'\n')
-        os.write(fd, self.to_entry().encode('utf-8') + b'\n')
-        os.close(fd)
-
-
-class Replied:
-    def __init__(self, t_replier_id, t_replied_id):
-        self.header = 't_replier_id,t_replied_id'
-        self.t_replier_id = t_replier_id
-        self.t_replied_id = t_replied_id
-
-    def to_entry(self):
-        entry = ''
-        entry += f'{self.t_replier_id},'
-        entry += f'{self.t_replied_id}'
-        return entry
-
-    def save_to_file(self, output_dir, filename):
-        filename = f'{output_dir}/replied_{filename}'
-        store_header = not os.path.isfile(filename)
-        fd = os.open(filename, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o660)
-        if store_header:
-            os.write(fd, self.header.encode('utf-8') + b'\n')
-        os.write(fd, self.to_entry().encode('utf-8') + b'\n')
-        os.close(fd)
-
-
-def followers_to_csv(entry, output_dir, filename):
-    '''converts input from the followers function into csv'''
-    followed = User(entry['follows'])
-    followed.save_to_file(output_dir, filename)
-    follower = User(entry)
-    follower.save_to_file(output_dir, filename)
-
-    relation = Follows(follower.id, followed.id, entry['follower_number'])
-    relation.save_to_file(output_dir, filename)
-
-
-def profile_to_csv(entry, output_dir, filename):
-    '''converts input from the profile function into csv'''
-    user = User(entry)
-    user.save_to_file(output_dir, filename)
-
-
-def friends_to_csv(entry, output_dir, filename):
-    '''converts input from the friends function into csv'''
-    follower = User(entry['is_followed_by'])
-    follower.save_to_file(output_dir, filename)
-    followed = User(entry)
-    followed.save_to_file(output_dir, filename)
-
-    relation = Followed(followed.id, follower.id)
-    relation.save_to_file(output_dir, filename)
-
-
-def timeline_to_csv(entry, output_dir, filename):
-    '''converts input from the timeline function into csv'''
-    tweet = Tweet(entry)
-    tweet.save_to_file(output_dir, filename)
-
-    user = User(entry['user'])
-    user.save_to_file(output_dir, filename)
-
-    relation = Tweeted(user.id, tweet.id)
-    relation.save_to_file(output_dir, filename)
-
-
-def stream_to_csv(entry, output_dir, filename):
-    '''converts input from the watch function into csv'''
+users_saved = DedupStore()
+tweets_saved = DedupStore()
+edges_saved = {table: DedupStore(key_size=16) for table in RELATION_TYPES}
+
+# print results as one line of json each, to be piped to other tools
+compact_stdout = False
+
+
+# default columns of the users and tweets csv files, attributes of share/models
+USER_CSV_COLUMNS = ['id', 'name', 'screen_name', 'location', 'description', 'protected', 'followers_count', 'friends_count', 'listed_count', 'statuses_count', 'created_at', 'favourites_count', 'verified', 'profile_use_background_image', 'has_extended_profile', 'default_profile', 'default_profile_image']
+TWEET_CSV_COLUMNS = ['id', 'text', 'truncated', 'is_quote_status', 'retweet_count', 'favorite_count', 'possibly_sensitive', 'lang']
+
+# the csv files name the id column uid, as expected by janusgraph
+CSV_HEADER_NAMES = {'id': 'uid'}
+
+# global variables holding the record types of the users and tweets csv files
+csv_types = {}
+
+# attributes stored as parquet columns, None stores all of them
+parquet_columns = {'users': None, 'tweets': None}
+
+
+def configure_dedup(mode='exact', capacity=10000000, error_rate=0.001, dedup_dir=None, dedup_edges=True):
+    '''replaces the stores used to avoid writing the same user, tweet or relation twice'''
+    global users_saved, tweets_saved, edges_saved
+
+    def store_path(table):
+        if dedup_dir is None:
+            return None
+        return os.path.join(dedup_dir, f'{table}.{mode}')
+
+    users_saved = DedupStore(mode, capacity, error_rate, store_path('users'))
+    tweets_saved = DedupStore(mode, capacity, error_rate, store_path('tweets'))
+    edges_saved = {}
+    if dedup_edges:
+        for table in RELATION_TYPES:
+            edges_saved[table] = DedupStore(mode, capacity, error_rate, store_path(table), key_size=16)
+
+
+def configure_columns(user_columns=None, tweet_columns=None):
+    '''
+    selects the attributes stored as csv and parquet columns,
+    building the record types of the users and tweets csv rows
+    '''
+    columns = {'users': user_columns, 'tweets': tweet_columns}
+    defaults = {'users': USER_CSV_COLUMNS, 'tweets': TWEET_CSV_COLUMNS}
+    for table in ENTITY_TABLES:
+        csv_types[table] = entity_type(table, columns[table] or defaults[table])
+        parquet_columns[table] = columns[table]
+
+
+def configure_stdout(compact=False):
+    global compact_stdout
+    compact_stdout = compact
+
+
+def save_dedup():
+    '''persists the dedup stores, if they were configured with a directory'''
+    users_saved.save()
+    tweets_saved.save()
+    for store in edges_saved.values():
+        store.save()
+
+
+def followers_to_rows(entry):
+    '''splits input from the followers function into users and relations'''
+    followed = entry['follows']
+    yield 'users', followed
+    yield 'users', entry
+    yield 'follows', Follows(entry['id'], followed['id'], entry['follower_number'])
+
+
+def follower_ids_to_rows(entry):
+    '''splits input from the followers function without profiles into the followed user and relations'''
+    followed = entry['follows']
+    yield 'users', followed
+    yield 'follows', Follows(entry['id'], followed['id'], entry['follower_number'])
+
+
+def profile_to_rows(entry):
+    '''splits input from the profile function into users'''
+    yield 'users', entry
+
+
+def friends_to_rows(entry):
+    '''splits input from the friends function into users and relations'''
+    follower = entry['is_followed_by']
+    yield 'users', follower
+    yield 'users', entry
+    yield 'followed', Followed(entry['id'], follower['id'])
+
+
+def friend_ids_to_rows(entry):
+    '''splits input from the friends function without profiles into the following user and relations'''
+    follower = entry['is_followed_by']
+    yield 'users', follower
+    yield 'followed', Followed(entry['id'], follower['id'])
+
+
+def timeline_to_rows(entry):
+    '''splits input from the timeline function into tweets, users and relations'''
+    yield 'tweets', entry
+    yield 'users', entry['user']
+    yield 'tweeted', Tweeted(entry['user']['id'], entry['id'])
+
+
+def stream_to_rows(entry):
+    '''splits input from the watch function into tweets, users and relations'''
     t = entry['tweet']
     if entry['type'] == 'retweet':
-        user_retweeter = User(t['user'])
-        user_retweeter.save_to_file(output_dir, filename)
-        user_retweeted = User(t['retweeted_status']['user'])
-        user_retweeted.save_to_file(output_dir, filename)
-
-        tweet_retweeted = Tweet(t['retweeted_status'])
-        tweet_retweeted.save_to_file(output_dir, filename)
-        tweet_retweeter = Tweet(t)
-        tweet_retweeter.save_to_file(output_dir, filename)
-
-        tweeted = Tweeted(user_retweeted.id, tweet_retweeted.id)
-        tweeted.save_to_file(output_dir, filename)
-        tweeted = Tweeted(user_retweeter.id, tweet_retweeter.id)
-        tweeted.save_to_file(output_dir, filename)
-
-        retweeted = Retweeted(tweet_retweeter.id, tweet_retweeted.id)
-        retweeted.save_to_file(output_dir, filename)
+        retweeted = t['retweeted_status']
+        yield 'users', t['user']
+        yield 'users', retweeted['user']
+        yield 'tweets', retweeted
+        yield 'tweets', t
+        yield 'tweeted', Tweeted(retweeted['user']['id'], retweeted['id'])
+        yield 'tweeted', Tweeted(t['user']['id'], t['id'])
+        yield 'retweeted', Retweeted(t['id'], retweeted['id'])
     elif entry['type'] == 'reply':
-        user_replier = User(t['user'])
-        user_replier.save_to_file(output_dir, filename)
-        user_replied = User(entry['replied_to']['user'])
-        user_replied.save_to_file(output_dir, filename)
-
-        tweet_replier = Tweet(t)
-        tweet_replier.save_to_file(output_dir, filename)
-        tweet_replied = Tweet(entry['replied_to'])
-        tweet_replied.save_to_file(output_dir, filename)
-
-        relation = Tweeted(user_replier.id, tweet_replier.id)
-        relation.save_to_file(output_dir, filename)
-        relation = Tweeted(user_replied.id, tweet_replied.id)
-        relation.save_to_file(output_dir, filename)
-
-        relation = Replied(tweet_replier.id, tweet_replied.id)
-        relation.save_to_file(output_dir, filename)
+        replied = entry['replied_to']
+        yield 'users', t['user']
+        yield 'users', replied['user']
+        yield 'tweets', t
+        yield 'tweets', replied
+        yield 'tweeted', Tweeted(t['user']['id'], t['id'])
+        yield 'tweeted', Tweeted(replied['user']['id'], replied['id'])
+        yield 'replied', Replied(t['id'], replied['id'])
     elif entry['type'] == 'quote':
-        user_quoter = User(t['user'])
-        user_quoter.save_to_file(output_dir, filename)
-        user_quoted = User(t['quoted_status']['user'])
-        user_quoted.save_to_file(output_dir, filename)
-
-        tweet_quoter = Tweet(t)
-        tweet_quoter.save_to_file(output_dir, filename)
-        tweet_quoted = Tweet(t['quoted_status'])
-        tweet_quoted.save_to_file(output_dir, filename)
-
-        relation = Tweeted(user_quoter.id, tweet_quoter.id)
-        relation.save_to_file(output_dir, filename)
-        relation = Tweeted(user_quoted.id, tweet_quoted.id)
-        relation.save_to_file(output_dir, filename)
-
-        retweeted = Retweeted(tweet_quoter.id, tweet_quoted.id)
-        retweeted.save_to_file(output_dir, filename)
+        quoted = t['quoted_status']
+        yield 'users', t['user']
+        yield 'users', quoted['user']
+        yield 'tweets', t
+        yield 'tweets', quoted
+        yield 'tweeted', Tweeted(t['user']['id'], t['id'])
+        yield 'tweeted', Tweeted(quoted['user']['id'], quoted['id'])
+        yield 'retweeted', Retweeted(t['id'], quoted['id'])
     elif entry['type'] == 'tweet':
-        user = User(entry['tweet']['user'])
-        user.save_to_file(output_dir, filename)
+        yield 'users', t['user']
+        yield 'tweets', t
+        yield 'tweeted', Tweeted(t['user']['id'], t['id'])
+    else:
+        raise Exception(f'unknown entry type \'{entry["type"]}\' for watch')
 
-        tweet = Tweet(entry['tweet'])
-        tweet.save_to_file(output_dir, filename)
 
-        tweeted = Tweeted(user.id, tweet.id)
-        tweeted.save_to_file(output_dir, filename)
+def split_entry(entry):
+    '''
+    splits an entry into the users, tweets and relations it contains
+    yields (table, row) tuples, where row is the json of a user or tweet
+    or the record of a relation
+    '''
+    entry_type = entry.get('og_type', None)
+    if entry_type == 'get_followers':
+        return followers_to_rows(entry)
+    elif entry_type == 'get_followers_ids':
+        return follower_ids_to_rows(entry)
+    elif entry_type == 'get_profile':
+        return profile_to_rows(entry)
+    elif entry_type == 'get_friends':
+        return friends_to_rows(entry)
+    elif entry_type == 'get_friends_ids':
+        return friend_ids_to_rows(entry)
+    elif (entry_type == 'get_timeline' or
+          entry_type == 'get_timeline_new' or
+          entry_type == 'search'):
+        return timeline_to_rows(entry)
+    elif entry_type == 'watch' or entry_type == 'search_new':
+        return stream_to_rows(entry)
     else:
-        raise Exception(f'unknown entry type \'{entry["type"]}\' for watch')
+        raise Exception('split_entry: entry type \'{}\' not supported'.format(entry_type))
 
 
-def store_result(output_dir, entry, csv, jsonl, filename, start_time):
-    '''save the result in as a .csv, .jsonl, janus .csv or print as json'''
-    if csv:
+def store_result(output_dir, entry, output_format, filename, start_time):
+    '''save the result in as a .csv, .jsonl, .parquet, in a sqlite database or print as json'''
+    if output_format == 'csv':
         filename = f'{filename}_{start_time}.csv'
         save_as_csv(entry, output_dir, filename)
-    elif jsonl:
+    elif output_format == 'jsonl':
         filename = f'{filename}_{start_time}.jsonl'
         save_as_jsonl(entry, output_dir, filename)
+    elif output_format == 'parquet':
+        filename = f'{filename}_{start_time}.parquet'
+        save_as_parquet(entry, output_dir, filename)
+    elif output_format == 'sqlite':
+        save_as_sqlite(entry, output_dir)
+    elif compact_stdout:
+        sys.stdout.write(dumps(entry).decode('utf-8') + '\n')
     else:
-        print(json.dumps(entry, indent=4, sort_keys=True))
+        print(dumps_pretty(entry))
 
 
 def save_as_csv(entry, output_dir, filename):
     '''Takes an entry as input and saves it in CSV format, optimized for janusgraph'''
-    entry_type = entry.get('og_type', None)
-    if entry_type == 'get_followers':
-        followers_to_csv(entry, output_dir, filename)
-    elif entry_type == 'get_profile':
-        profile_to_csv(entry, output_dir, filename)
-    elif entry_type == 'get_friends':
-        friends_to_csv(entry, output_dir, filename)
-    elif (entry_type == 'get_timeline' or
-          entry_type == 'get_timeline_new' or
-          entry_type == 'search'):
-        timeline_to_csv(entry, output_dir, filename)
-    elif entry_type == 'watch' or entry_type == 'search_new':
-        stream_to_csv(entry, output_dir, filename)
-    else:
-        raise Exception('save_as_janus: entry type \'{}\' not supported'.format(entry_type))
+    if not csv_types:
+        configure_columns()
+    for table, row in split_entry(entry):
+        if is_saved(table, row):
+            continue
+        if table in csv_types:
+            row = csv_types[table].from_json(row)
+        writer = open_writer(f'{output_dir}/{table}_{filename}', csv_header(row))
+        writer.write_row(row)
+
+
+def is_saved(table, row):
+    '''returns True if the user, tweet or relation was already stored'''
+    if table == 'users':
+        return not users_saved.add(row['id'])
+    if table == 'tweets':
+        return not tweets_saved.add(row['id'])
+    store = edges_saved.get(table)
+    if store is None:
+        return False
+    # relations are identified by their table and the ids they relate
+    return not store.add(edge_key(row[0], row[1]))
+
+
+def csv_header(record):
+    return [CSV_HEADER_NAMES.get(name, name) for name in record._fields]
+
+
+def save_as_parquet(entry, output_dir, filename):
+    '''Takes an entry as input and buffers it into the columns of parquet files'''
+    for table, row in split_entry(entry):
+        if is_saved(table, row):
+            continue
+        open_table(f'{output_dir}/{table}_{filename}', table, parquet_columns.get(table)).append(row)
+
+
+def save_as_sqlite(entry, output_dir):
+    '''Takes an entry as input and upserts its users, tweets and relations in a sqlite database'''
+    database = open_database(f'{output_dir}/{DATABASE_NAME}')
+    for table, row in split_entry(entry):
+        database.add(table, row)
 
 
 def save_as_jsonl(entry, output_dir, jsonfile):
     '''Takes an entry as input and saves it in a JSON L file.'''
-    fd = os.open(f'{output_dir}/{jsonfile}', os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o660)
-    os.write(fd, json.dumps(entry).encode('utf-8') + b'\n')
-    os.close(fd)
-
+    writer = open_writer(f'{output_dir}/{jsonfile}')
+    writer.write(dumps(entry) + b'\n')
@@ -0,0 +1,104 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import atexit
+import threading
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+from .records import entity_type, ENTITY_TABLES, RELATION_TYPES
+
+# rows buffered per table before they are written as a parquet row group
+ROW_GROUP_SIZE = 50000
+
+# columns with few distinct values, stored dictionary encoded
+DICTIONARY_COLUMNS = ['lang', 'screen_name', 'source', 'time_zone', 'translator_type', 'in_reply_to_screen_name', 'metadata_iso_language_code', 'metadata_result_type']
+
+# global variables holding the parquet files opened during the run, one per table
+tables = {}
+tables_lock = threading.Lock()
+
+
+def arrow_type(kind):
+    if kind == 'int':
+        return pyarrow.int64()
+    if kind == 'bool':
+        return pyarrow.bool_()
+    if kind == 'datetime':
+        return pyarrow.timestamp('s', tz='UTC')
+    return pyarrow.string()
+
+
+class ParquetTable:
+    '''
+    buffers the records of a table and writes them
+    to a parquet file as row groups of typed columns
+    '''
+
+    def __init__(self, path, table, columns=None):
+        self.path = path
+        self.lock = threading.Lock()
+        if table in ENTITY_TABLES:
+            self.record_type = entity_type(table, columns, typed=True)
+            fields = [pyarrow.field(a.name, arrow_type(a.kind)) for a in self.record_type.attributes]
+        else:
+            self.record_type = RELATION_TYPES[table]
+            fields = [pyarrow.field(name, pyarrow.int64()) for name in self.record_type._fields]
+        self.schema = pyarrow.schema(fields)
+        self.records = []
+        self.writer = None
+
+    def append(self, row):
+        '''buffers a row, row is the json of an entity or the record of a relation'''
+        if self.record_type.attributes is not None:
+            row = self.record_type.from_json(row)
+        with self.lock:
+            self.records.append(row)
+            if len(self.records) >= ROW_GROUP_SIZE:
+                self.__write_row_group()
+
+    def close(self):
+        with self.lock:
+            self.__write_row_group()
+            if self.writer is not None:
+                self.writer.close()
+                self.writer = None
+
+    def __write_row_group(self):
+        if not self.records:
+            return
+        if self.writer is None:
+            use_dictionary = [name for name in self.schema.names if name in DICTIONARY_COLUMNS]
+            self.writer = pyarrow.parquet.ParquetWriter(self.path, self.schema, use_dictionary=use_dictionary)
+        columns = [list(column) for column in zip(*self.records)]
+        table = pyarrow.Table.from_arrays(columns, schema=self.schema)
+        self.writer.write_table(table)
+        self.records = []
+
+
+def open_table(path, table, columns=None):
+    '''returns the parquet table stored in path, creating it the first time it is used'''
+    if pyarrow is None:
+        raise Exception('parquet output requires pyarrow, install it with: pip install pyarrow')
+    parquet_table = tables.get(path)
+    if parquet_table is not None:
+        return parquet_table
+    with tables_lock:
+        if path not in tables:
+            tables[path] = ParquetTable(path, table, columns)
+        return tables[path]
+
+
+def close_tables():
+    '''writes the buffered rows and the footer of each parquet file'''
+    with tables_lock:
+        for parquet_table in tables.values():
+            parquet_table.close()
+        tables.clear()
+
+
+atexit.register(close_tables)
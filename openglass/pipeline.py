@@ -0,0 +1,137 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import queue
+import threading
+
+DROP_POLICIES = ['block', 'drop-new', 'drop-old']
+
+
+class Pipeline:
+    '''
+    bounded producer/consumer queue, producers put items and
+    a pool of worker threads processes them in the background
+
+    when the queue is full the drop policy decides what happens:
+    block waits for room, drop-new discards the new item and
+    drop-old discards the oldest queued item
+
+    items are numbered as they are put, wait() blocks until every
+    item put up to a number has been processed or dropped
+    '''
+
+    def __init__(self, worker, num_workers=1, maxsize=10000, drop_policy='block', name='pipeline'):
+        if drop_policy not in DROP_POLICIES:
+            raise Exception(f'unknown drop policy \'{drop_policy}\'')
+        self.worker = worker
+        self.drop_policy = drop_policy
+        self.queue = queue.Queue(maxsize)
+        self.lock = threading.Lock()
+        self.finished_changed = threading.Condition(self.lock)
+        self.sequence = 0
+        self.finished = 0
+        self.finished_items = set()
+        self.processed = 0
+        self.dropped = 0
+        self.max_depth = 0
+        self.error = None
+        self.threads = []
+        for i in range(num_workers):
+            thread = threading.Thread(target=self.__work, name=f'{name}-{i}', daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def put(self, item):
+        '''queues an item, raising the error of a worker if one failed'''
+        if self.error is not None:
+            raise self.error
+        with self.lock:
+            self.sequence += 1
+            item = (self.sequence, item)
+        if self.drop_policy == 'block':
+            self.queue.put(item)
+        elif self.drop_policy == 'drop-new':
+            try:
+                self.queue.put_nowait(item)
+            except queue.Full:
+                with self.lock:
+                    self.dropped += 1
+                self.__finish(item[0])
+        else:
+            while True:
+                try:
+                    self.queue.put_nowait(item)
+                    break
+                except queue.Full:
+                    pass
+                try:
+                    old_item = self.queue.get_nowait()
+                    self.queue.task_done()
+                    with self.lock:
+                        self.dropped += 1
+                    self.__finish(old_item[0])
+                except queue.Empty:
+                    pass
+        depth = self.queue.qsize()
+        if depth > self.max_depth:
+            self.max_depth = depth
+
+    @property
+    def depth(self):
+        return self.queue.qsize()
+
+    def stats(self):
+        return {
+            'depth': self.depth,
+            'max_depth': self.max_depth,
+            'processed': self.processed,
+            'dropped': self.dropped,
+        }
+
+    def wait(self, sequence=None):
+        '''waits until the items put so far, or up to sequence, are processed'''
+        with self.lock:
+            if sequence is None:
+                sequence = self.sequence
+            while self.finished < sequence and self.error is None:
+                self.finished_changed.wait()
+        if self.error is not None:
+            raise self.error
+
+    def close(self):
+        '''waits until the queued items are processed and stops the workers'''
+        for _ in self.threads:
+            self.queue.put(None)
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+        if self.error is not None:
+            raise self.error
+
+    def __finish(self, sequence):
+        with self.lock:
+            self.finished_items.add(sequence)
+            while self.finished + 1 in self.finished_items:
+                self.finished += 1
+                self.finished_items.remove(self.finished)
+            self.finished_changed.notify_all()
+
+    def __work(self):
+        while True:
+            item = self.queue.get()
+            try:
+                if item is None:
+                    return
+                if self.error is None:
+                    self.worker(item[1])
+                    with self.lock:
+                        self.processed += 1
+            except BaseException as e:
+                # keep consuming so producers never block forever on a full queue
+                self.error = e
+                with self.lock:
+                    self.finished_changed.notify_all()
+            finally:
+                self.queue.task_done()
+                if item is not None:
+                    self.__finish(item[0])
@@ -0,0 +1,114 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import time
+import hashlib
+import threading
+
+# twitter counts the requests of each key and endpoint in windows of 15 minutes
+WINDOW = 15 * 60
+
+# requests assumed per window for endpoints that were not declared
+DEFAULT_REQUESTS_PER_WINDOW = 15
+
+# seconds waited after the reset time, to absorb clock differences with twitter
+RESET_MARGIN = 2
+
+
+def key_id(credentials):
+    '''identifies an api key without exposing its secrets'''
+    key = '{}:{}'.format(credentials['CONSUMER_KEY'], credentials['ACCESS_KEY'])
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]
+
+
+class Budget:
+    '''requests left to a key on an endpoint until the window resets'''
+
+    __slots__ = ['limit', 'remaining', 'reset']
+
+    def __init__(self, limit, remaining, reset):
+        self.limit = limit
+        self.remaining = remaining
+        self.reset = reset
+
+
+class RateLimiter:
+    '''
+    keeps the budget of each key on each endpoint, taken from the
+    x-rate-limit-* headers of the responses or from the declared window
+    sizes, and hands out the key with the most requests left
+
+    when every key is exhausted it sleeps until the first window resets
+    instead of waiting for twitter to answer with a 429
+    '''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.limits = {}
+        self.budgets = {}
+
+    def declare(self, endpoint, requests_per_window):
+        '''sets the requests per window of an endpoint, used until twitter reports it'''
+        with self.lock:
+            self.limits.setdefault(endpoint, requests_per_window)
+
+    def acquire(self, endpoint, keys):
+        '''reserves a request on the key with the most headroom and returns the key'''
+        if len(keys) == 0:
+            raise Exception('there are no api keys left')
+        while True:
+            with self.lock:
+                now = time.time()
+                budgets = [(self.__budget(key, endpoint, now), key) for key in keys]
+                budget, key = max(budgets, key=lambda b: b[0].remaining)
+                if budget.remaining > 0:
+                    budget.remaining -= 1
+                    return key
+                wait = min(b.reset for b, _ in budgets) - now
+            time.sleep(max(0, wait) + RESET_MARGIN)
+
+    def update(self, key, endpoint, headers):
+        '''updates the budget of a key with the rate limit headers of a response'''
+        limit, remaining, reset = parse_headers(headers)
+        if remaining is None or reset is None:
+            return
+        with self.lock:
+            budget = self.__budget(key, endpoint, time.time())
+            if limit is not None:
+                self.limits[endpoint] = limit
+                budget.limit = limit
+            # requests reserved after this one was sent are not counted in its headers
+            if reset == budget.reset:
+                remaining = min(remaining, budget.remaining)
+            budget.remaining = remaining
+            budget.reset = reset
+
+    def exhausted(self, key, endpoint, headers=None):
+        '''marks a key as exhausted on an endpoint, after twitter answered with a 429'''
+        reset = None
+        if headers is not None:
+            _, _, reset = parse_headers(headers)
+        with self.lock:
+            budget = self.__budget(key, endpoint, time.time())
+            budget.remaining = 0
+            if reset is not None:
+                budget.reset = reset
+
+    def __budget(self, key, endpoint, now):
+        budget = self.budgets.get((key, endpoint))
+        if budget is None or now >= budget.reset:
+            limit = self.limits.get(endpoint, DEFAULT_REQUESTS_PER_WINDOW)
+            budget = Budget(limit, limit, now + WINDOW)
+            self.budgets[(key, endpoint)] = budget
+        return budget
+
+
+def parse_headers(headers):
+    '''returns the limit, remaining requests and reset time of a response'''
+    values = []
+    for name in ['x-rate-limit-limit', 'x-rate-limit-remaining', 'x-rate-limit-reset']:
+        try:
+            values.append(int(headers[name]))
+        except (KeyError, TypeError, ValueError):
+            values.append(None)
+    return values
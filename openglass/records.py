@@ -0,0 +1,48 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from collections import namedtuple
+
+from .models import select_attributes, compile_encoder
+
+# models in share/models describing the users and tweets tables
+TABLE_MODELS = {
+    'users': 'twitter_user',
+    'tweets': 'tweet',
+}
+
+ENTITY_TABLES = list(TABLE_MODELS)
+
+
+def entity_type(table, columns=None, typed=False):
+    '''
+    returns a record type holding the attributes of the users or tweets
+    named in columns, all of them if columns is None
+
+    records are tuples, they have no per-instance __dict__, and the type
+    keeps the schema: table, attributes and from_json, which builds a
+    record from the json of an entity
+    '''
+    attributes = select_attributes(TABLE_MODELS[table], columns)
+    record = namedtuple('User' if table == 'users' else 'Tweet', [a.name for a in attributes])
+    record.table = table
+    record.attributes = attributes
+    record.from_json = staticmethod(compile_encoder(attributes, typed, factory=record))
+    return record
+
+
+def relation_type(name, table, fields):
+    '''returns a record type holding the ids of a relation'''
+    record = namedtuple(name, fields)
+    record.table = table
+    record.attributes = None
+    return record
+
+
+Follows = relation_type('Follows', 'follows', ['follower_id', 'followed_id', 'follower_number'])
+Followed = relation_type('Followed', 'followed', ['followed_id', 'follower_id'])
+Tweeted = relation_type('Tweeted', 'tweeted', ['user_id', 'tweet_id'])
+Retweeted = relation_type('Retweeted', 'retweeted', ['t_retweeter_id', 't_retweeted_id'])
+Replied = relation_type('Replied', 'replied', ['t_replier_id', 't_replied_id'])
+
+RELATION_TYPES = {record.table: record for record in [Follows, Followed, Tweeted, Retweeted, Replied]}
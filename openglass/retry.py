@@ -0,0 +1,115 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import time
+import random
+import threading
+
+# seconds waited before the first retry, doubled on each following one
+BASE_DELAY = 1
+
+# the most seconds waited before a retry
+MAX_DELAY = 5 * 60
+
+# retries of unknown errors before they are raised
+MAX_ATTEMPTS = 5
+
+# consecutive failures of an endpoint with a key that open its circuit
+BREAKER_THRESHOLD = 5
+
+# seconds requests to an open circuit wait before one of them tries again
+BREAKER_COOLDOWN = 60
+
+
+class RetryPolicy:
+    '''
+    decides how long failed requests wait before they are retried, a random
+    time up to a delay doubled on each attempt (exponential backoff with full
+    jitter) or the Retry-After of the response if twitter sent one
+
+    each endpoint and key has a circuit breaker, after consecutive failures
+    it opens and the requests to it wait for the cooldown, then the next one
+    goes through and closes it if it succeeds
+
+    it counts the retries and the time they lost
+    '''
+
+    def __init__(self, base_delay=BASE_DELAY, max_delay=MAX_DELAY, max_attempts=MAX_ATTEMPTS,
+                 breaker_threshold=BREAKER_THRESHOLD, breaker_cooldown=BREAKER_COOLDOWN):
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_attempts = max_attempts
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown = breaker_cooldown
+        self.lock = threading.Lock()
+        # (endpoint, key): consecutive failures
+        self.failures = {}
+        # (endpoint, key): time the circuit opened
+        self.opened = {}
+        self.retries = 0
+        self.time_lost = 0.0
+        self.circuits_opened = 0
+
+    def delay(self, attempt, retry_after=None):
+        '''returns the seconds to wait before the retry number attempt'''
+        if retry_after is not None:
+            return min(retry_after, self.max_delay)
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def wait(self, attempt, retry_after=None):
+        '''sleeps before the retry number attempt'''
+        seconds = self.delay(attempt, retry_after)
+        with self.lock:
+            self.retries += 1
+            self.time_lost += seconds
+        time.sleep(seconds)
+
+    def before(self, endpoint, key):
+        '''waits while the circuit of an endpoint and key is open'''
+        while True:
+            with self.lock:
+                opened = self.opened.get((endpoint, key))
+                if opened is None:
+                    return
+                seconds = opened + self.breaker_cooldown - time.time()
+                if seconds <= 0:
+                    # this request tries the endpoint, the rest wait for another cooldown
+                    self.opened[(endpoint, key)] = time.time()
+                    return
+                self.time_lost += seconds
+            # the requests that waited check again, only one of them goes through
+            time.sleep(seconds)
+
+    def success(self, endpoint, key):
+        with self.lock:
+            self.failures.pop((endpoint, key), None)
+            self.opened.pop((endpoint, key), None)
+
+    def failure(self, endpoint, key):
+        with self.lock:
+            failures = self.failures.get((endpoint, key), 0) + 1
+            self.failures[(endpoint, key)] = failures
+            if failures >= self.breaker_threshold and (endpoint, key) not in self.opened:
+                self.opened[(endpoint, key)] = time.time()
+                self.circuits_opened += 1
+                print(f'\n{endpoint} failed {failures} times in a row, waiting {self.breaker_cooldown}s before trying it again')
+
+    def stats(self):
+        with self.lock:
+            return {
+                'retries': self.retries,
+                'time_lost': self.time_lost,
+                'circuits_opened': self.circuits_opened,
+                'open_circuits': len(self.opened),
+            }
+
+
+def retry_after(e):
+    '''returns the seconds of the Retry-After header of the response of an error, if there is one'''
+    response = getattr(e, 'response', None)
+    if response is None:
+        return None
+    try:
+        return max(0, int(response.headers['retry-after']))
+    except (KeyError, TypeError, ValueError):
+        return None
@@ -0,0 +1,80 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import json
+from datetime import datetime
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+BACKENDS = ['auto', 'orjson', 'ujson', 'json']
+
+# the json library used, the fastest one installed unless another is selected
+backend = 'orjson' if orjson is not None else 'ujson' if ujson is not None else 'json'
+
+
+# some functions to parse json date
+class DateTimeEncoder(json.JSONEncoder):
+    def default(self, o):
+        if isinstance(o, datetime):
+            return o.isoformat()
+
+        if isinstance(o, bytes):
+            return list(o)
+
+        return json.JSONEncoder.default(self, o)
+
+
+def default(o):
+    '''encodes the objects the json libraries do not support, like DateTimeEncoder'''
+    if isinstance(o, datetime):
+        return o.isoformat()
+    if isinstance(o, bytes):
+        return list(o)
+    raise TypeError(f'Object of type {type(o).__name__} is not JSON serializable')
+
+
+def select_backend(name='auto'):
+    '''selects the json library, auto picks the fastest one installed'''
+    global backend
+    if name == 'auto':
+        backend = 'orjson' if orjson is not None else 'ujson' if ujson is not None else 'json'
+    elif name == 'orjson' and orjson is None:
+        raise Exception('orjson is not installed, install it with: pip install orjson')
+    elif name == 'ujson' and ujson is None:
+        raise Exception('ujson is not installed, install it with: pip install ujson')
+    else:
+        backend = name
+
+
+def dumps(obj):
+    '''returns obj as compact json, encoded as utf-8 bytes'''
+    if backend == 'orjson':
+        return orjson.dumps(obj, default=default)
+    if backend == 'ujson':
+        return ujson.dumps(obj, ensure_ascii=False, default=default).encode('utf-8')
+    return json.dumps(obj, cls=DateTimeEncoder).encode('utf-8')
+
+
+def dumps_pretty(obj):
+    '''
+    returns obj as indented json with sorted keys, always encoded with
+    the standard library so the output is the same with every backend
+    '''
+    return json.dumps(obj, indent=4, sort_keys=True, default=default)
+
+
+def loads(data):
+    '''parses json from str or bytes'''
+    if backend == 'orjson':
+        return orjson.loads(data)
+    if backend == 'ujson':
+        return ujson.loads(data)
+    return json.loads(data)
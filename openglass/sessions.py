@@ -0,0 +1,56 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import threading
+import requests
+import tweepy.binder
+
+# connections kept open to each host by the session of a thread
+POOL_SIZE = 10
+
+sessions = threading.local()
+
+
+class PersistentSession(requests.Session):
+    '''
+    requests session whose connections outlive the api calls of tweepy,
+    which closes the session of each call once it returns
+    '''
+
+    def __init__(self):
+        super().__init__()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+        self.mount('https://', adapter)
+        self.mount('http://', adapter)
+
+    def close(self):
+        '''keeps the connections open for the next calls'''
+        pass
+
+
+def thread_session():
+    '''returns the persistent session of the current thread'''
+    session = getattr(sessions, 'session', None)
+    if session is None:
+        session = PersistentSession()
+        sessions.session = session
+    return session
+
+
+class SessionFactory:
+    '''stands for the requests module in tweepy.binder, handing out the persistent sessions'''
+
+    def Session(self):
+        return thread_session()
+
+    def __getattr__(self, name):
+        return getattr(requests, name)
+
+
+def install():
+    '''
+    makes the api calls of tweepy reuse a keep-alive session per thread,
+    instead of a new session, with its tcp and tls handshakes, per call
+    '''
+    if not isinstance(tweepy.binder.requests, SessionFactory):
+        tweepy.binder.requests = SessionFactory()
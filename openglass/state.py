@@ -0,0 +1,103 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import shutil
+import hashlib
+import threading
+
+from .serialize import dumps, loads
+
+# the state of a job is written at most once every this many seconds
+CHECKPOINT_INTERVAL = 30
+
+
+class StateStore:
+    '''
+    state of a job kept as json in its folder of the persistent directory,
+    it is written atomically so a job stopped at any point can be resumed
+    from its last checkpoint
+
+    before_save is called before each checkpoint is written, it has to
+    write the results the checkpoint covers and can return more values
+    to store with it
+    '''
+
+    def __init__(self, state_dir, interval=CHECKPOINT_INTERVAL):
+        self.state_dir = state_dir
+        self.path = os.path.join(state_dir, 'state.json')
+        self.interval = interval
+        self.lock = threading.RLock()
+        self.state = {'cursors': {}}
+        self.before_save = None
+        self.last_save = time.time()
+
+    def load(self):
+        '''loads the last checkpoint, returns False if there is none'''
+        if not os.path.isfile(self.path):
+            return False
+        with open(self.path, 'rb') as f:
+            self.state = loads(f.read())
+        self.state.setdefault('cursors', {})
+        return True
+
+    def get(self, key, default=None):
+        with self.lock:
+            return self.state.get(key, default)
+
+    def set(self, key, value):
+        with self.lock:
+            self.state[key] = value
+
+    def cursor(self, key):
+        '''
+        returns the position of a cursor, a dict that is updated
+        in place while its entries are handled
+        '''
+        with self.lock:
+            return self.state['cursors'].setdefault(key, {})
+
+    def finish_cursor(self, key):
+        with self.lock:
+            self.state['cursors'].pop(key, None)
+
+    def checkpoint(self, force=False):
+        '''writes the state if the checkpoint interval has passed'''
+        with self.lock:
+            if not force and time.time() - self.last_save < self.interval:
+                return
+            # the positions are copied before the results they cover are written
+            state = loads(dumps(self.state))
+            if self.before_save is not None:
+                values = self.before_save() or {}
+                state.update(values)
+                self.state.update(values)
+            tmp_path = f'{self.path}.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(dumps(state))
+            os.replace(tmp_path, self.path)
+            self.last_save = time.time()
+
+    def remove(self):
+        '''removes the folder of a finished job'''
+        with self.lock:
+            shutil.rmtree(self.state_dir, ignore_errors=True)
+
+
+def cursor_key(url_used, kwargs):
+    '''identifies a cursor by its endpoint and its parameters'''
+    return ' '.join([url_used] + [f'{name}={kwargs[name]}' for name in sorted(kwargs)])
+
+
+def build_state_dir(persistent_dir, job, clear=False):
+    '''
+    returns the folder holding the state of a job, job is a string
+    identifying it, the state of the last run is removed if clear is set
+    '''
+    job_hash = hashlib.sha1(job.encode('utf-8')).hexdigest()[:16]
+    state_dir = os.path.join(persistent_dir, 'state', job_hash)
+    if clear and os.path.isdir(state_dir):
+        shutil.rmtree(state_dir)
+    os.makedirs(state_dir, 0o700, True)
+    return state_dir
@@ -1,157 +1,580 @@
 #! /usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-import re
 import sys
 import json
 import time
 import uuid
 import http
 import math
+import queue
 import random
+import threading
 import urllib3
 import requests
 import tweepy
 
+from .ratelimit import RateLimiter, key_id
+from .crawler import DISCOVER_BATCH_SIZE
+from .state import cursor_key
+from .lookup import BatchResolver, ProfileCache, is_user_id
+from .pipeline import Pipeline
+from .serialize import loads
+from .retry import RetryPolicy, retry_after
+from .sessions import install as install_sessions
 
-class RotateKeys(Exception):
+# attributes of the tweepy cursor iterators saved to resume a cursor
+CURSOR_FIELDS = ['next_cursor', 'prev_cursor', 'num_tweets', 'max_id']
+
+# tweet ids start with the milliseconds since this time, in milliseconds since 1970
+SNOWFLAKE_EPOCH = 1288834974657
+
+# the search api returns the tweets of the last 7 days
+SEARCH_WINDOW = 7 * 24 * 60 * 60
+
+# tweets of a stream kept in memory so replies to them need no lookup
+REPLY_CACHE_SIZE = 10000
+
+# streams move to the next key after this many seconds, unless rotation is disabled
+STREAM_ROTATION_INTERVAL = 15 * 60
+
+# seconds the new stream of a rotation has to connect, otherwise the old one is kept
+STREAM_CONNECT_TIMEOUT = 30
+
+# seconds both streams of a rotation stay open once the new one is connected
+STREAM_OVERLAP = 5
+
+# statuses received by the streams that can wait to be processed
+STREAM_QUEUE_SIZE = 100000
+
+
+class StopQuery(KeyboardInterrupt):
     '''
-    exception raised on api rate limits
-    it is used for repacing the cursor or stream and
-    creating them again with new credentials
+    exception raised by entry handlers to stop a query after
+    the entry they received was stored
     '''
     pass
 
 
+class JSONParser(tweepy.parsers.JSONParser):
+    '''tweepy parser returning the decoded json of the responses, decoded with the selected json library'''
+
+    def parse(self, method, payload, return_cursors=False):
+        try:
+            json = loads(payload)
+        except Exception as e:
+            raise tweepy.error.TweepError(f'Failed to parse JSON payload: {e}')
+
+        if return_cursors and isinstance(json, dict):
+            if 'next' in json:
+                return json, json['next']
+            elif 'next_cursor' in json:
+                if 'previous_cursor' in json:
+                    return json, (json['previous_cursor'], json['next_cursor'])
+                return json, json['next_cursor']
+        return json
+
+
+class JSONIdIterator:
+    '''
+    pages through a timeline or a search by max_id like the IdIterator of
+    tweepy, which builds tweepy models of every page whatever the parser is
+    '''
+
+    def __init__(self, method, **kwargs):
+        self.method = method
+        self.kwargs = dict(kwargs)
+        self.max_id = self.kwargs.pop('max_id', None)
+        self.num_tweets = 0
+
+    def next(self):
+        entries = page_entries(self.method(max_id=self.max_id, **self.kwargs))
+        if len(entries) == 0:
+            raise StopIteration
+        self.max_id = min(entry['id'] for entry in entries) - 1
+        self.num_tweets += 1
+        return entries
+
+
+class DecodedResponse:
+    '''
+    raw response of a gzip stream read as tweepy reads an uncompressed one,
+    read1 returns the statuses decompressed as soon as they arrive, read
+    would wait for the full amount of compressed bytes
+    '''
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.raw.decode_content = True
+
+    def read(self, amt=None):
+        if hasattr(self.raw, 'read1'):
+            return self.raw.read1(amt)
+        return self.raw.read(amt)
+
+    def __getattr__(self, name):
+        return getattr(self.raw, name)
+
+
+class Stream(tweepy.Stream):
+    '''stream asking twitter for gzip, the statuses are a fraction of their size compressed'''
+
+    def __init__(self, auth, listener, **options):
+        options.setdefault('headers', {'Accept-Encoding': 'gzip'})
+        super().__init__(auth, listener, **options)
+
+    def _read_loop(self, resp):
+        if resp.headers.get('content-encoding') == 'gzip':
+            resp.raw = DecodedResponse(resp.raw)
+        super()._read_loop(resp)
+
+
 class StreamListener(tweepy.StreamListener):
-    def __init__(self, twitter, callback):
+    '''
+    listener of one stream connection, it only queues the statuses so the
+    connection is read as fast as twitter sends them, tweepy reconnects it
+    on errors and timeouts, errors it can not handle and the ones raised
+    while queueing stop it and are kept in error
+    '''
+
+    def __init__(self, twitter, enqueue, metrics):
         self.twitter = twitter
-        self.callback = callback
+        self.enqueue = enqueue
+        self.metrics = metrics
         self.search_id = twitter.search_id
         self.current_url = twitter.current_url
         self.type = twitter.type
-        self.last_rotation = time.time()
+        self.connected = threading.Event()
+        self.error = None
         super().__init__()
 
-    def on_status(self, entry):
-        self.callback(self, from_tweepy_obj_to_json(entry))
-        MINS_15 = 15 * 60
-        # re-create the stream each 15 minutes to avoid rate limits
-        if time.time() - self.last_rotation > MINS_15:
-            self.last_rotation = time.time()
-            self.__rotate_apikey()
+    def on_connect(self):
+        self.connected.set()
+
+    def on_data(self, raw_data):
+        if not self.twitter.raw_json:
+            return super().on_data(raw_data)
+        data = loads(raw_data)
+        if 'in_reply_to_status_id' in data:
+            return self.on_status(data)
+        # deletes, limits, warnings and disconnects are handled by tweepy
+        return super().on_data(raw_data)
+
+    def on_status(self, status):
+        try:
+            self.enqueue(self, status)
+        except BaseException as e:
+            # the stream stops and the thread waiting for it raises the error
+            self.error = e
+            return False
 
     def on_error(self, status_code):
-        self.__rotate_apikey()
         return True
 
     def on_timeout(self):
-        self.__rotate_apikey()
         return True
 
-    def __rotate_apikey(self):
-        '''raise a RotateKeys exception if there is more than one key'''
-        if len(self.twitter.twitter_apis) > 1:
-            raise RotateKeys()
+    def on_warning(self, notice):
+        self.metrics.warning(notice)
+
+    def on_disconnect(self, notice):
+        self.metrics.disconnect(notice)
+
+    def on_exception(self, exception):
+        self.error = exception
+
+
+class StreamMetrics:
+    '''
+    how far the processing of the streams of a query lags behind: the time
+    statuses wait in the queue and take to be processed, the stall warnings
+    twitter sends when the connection falls behind and its disconnect notices
+    '''
+
+    STAGES = ['queue', 'process']
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.count = {stage: 0 for stage in self.STAGES}
+        self.total = {stage: 0.0 for stage in self.STAGES}
+        self.max = {stage: 0.0 for stage in self.STAGES}
+        self.stall_warnings = 0
+        self.disconnects = 0
+        self.queue = None
+
+    def observe(self, stage, seconds):
+        with self.lock:
+            self.count[stage] += 1
+            self.total[stage] += seconds
+            self.max[stage] = max(self.max[stage], seconds)
+
+    def warning(self, notice):
+        with self.lock:
+            self.stall_warnings += 1
+        print('\nstream warning: {} ({}% of the twitter queue full)'.format(notice.get('message', notice.get('code')), notice.get('percent_full', '?')))
+
+    def disconnect(self, notice):
+        with self.lock:
+            self.disconnects += 1
+        print('\nstream disconnected by twitter: {}'.format(notice.get('reason', notice.get('code'))))
+
+    def stats(self):
+        with self.lock:
+            stats = {
+                'stall_warnings': self.stall_warnings,
+                'disconnects': self.disconnects,
+            }
+            for stage in self.STAGES:
+                count = self.count[stage]
+                stats[f'{stage}_avg'] = self.total[stage] / count if count > 0 else 0.0
+                stats[f'{stage}_max'] = self.max[stage]
+        if self.queue is not None:
+            stats.update(self.queue.stats())
+        return stats
 
 
 class Twitter:
 
-    def __init__(self, twitter_apis):
+    def __init__(self, twitter_apis, limiter=None, raw_json=False):
         self.twitter_apis = twitter_apis
+        # responses are decoded to dicts without building tweepy models
+        self.raw_json = raw_json
         if len(self.twitter_apis) == 0:
             exit('Provide at least one Twitter API key')
+        self.limiter = limiter if limiter is not None else RateLimiter()
+        # the backoff and circuit breakers of failed requests, shared with the children
+        self.retry = RetryPolicy()
+        # the state store where cursors save their position, if they are resumable
+        self.state = None
+        # the state store with the newest tweet id of each timeline and search, if they are incremental
+        self.since_ids = None
+        # the profiles already looked up, shared with the children
+        self.profiles = ProfileCache()
+        # seconds between stream key rotations, None disables them
+        self.stream_rotation = STREAM_ROTATION_INTERVAL
+        # threads processing the statuses of streams, and how many can wait for them
+        self.stream_threads = 1
+        self.stream_queue_size = STREAM_QUEUE_SIZE
+        # the metrics of the last stream
+        self.stream_metrics = None
+        # the key of the open stream, the rest requests never change it
+        self.stream_api_in_use = None
+        # the api calls of tweepy reuse keep-alive connections
+        install_sessions()
+        # a client for each key, authenticated once and reused by every rotation
+        self.clients = {}
         for twitter_api in self.twitter_apis:
-            twitter_api['expired_at'] = {}
+            self.__authenticate(twitter_api)
         self.api_in_use = random.choice(self.twitter_apis)
         self.api = self.__authenticate(self.api_in_use)
         self.current_url = ''
         self.search_id = str(uuid.uuid4())
         self.type = ''
 
-    def __query_api_with_cursor(self, url_used, entry_handler, apiname, **kwargs):
-        '''queries a tweepy api using cursors handling errors and rate limits'''
-        cursor = tweepy.Cursor(getattr(self.api, apiname),  **kwargs)
+    def __query_api_with_cursor(self, url_used, entry_handler, apiname, prepare=None, batch_size=None, **kwargs):
+        '''
+        queries a tweepy api using cursors handling errors and rate limits,
+        entries are handled one by one, if there is a prepare function it is
+        first called with lists of batch_size entries and returns the entries
+        to handle instead, with None for the ones to skip
+
+        if there is a state store the position of the cursor is saved after
+        each page, with the number of entries of the next page already handled,
+        and a cursor with the same endpoint and parameters starts from there
+        '''
+        # each page is requested with the key that has the most requests left
+        method = self.__limited_method(url_used, apiname)
+        if self.raw_json and getattr(method, 'pagination_mode', None) == 'id':
+            iterator = JSONIdIterator(method, **kwargs)
+        else:
+            iterator = tweepy.Cursor(method, **kwargs).pages()
+        key = cursor_key(url_used, kwargs)
+        position = self.state.cursor(key) if self.state is not None else {}
+        # held while entries are handled and positions updated, so a checkpoint
+        # taken by another cursor never saves rows its positions do not cover
+        lock = self.state.lock if self.state is not None else threading.Lock()
+        for name in CURSOR_FIELDS:
+            if name in position:
+                setattr(iterator, name, position[name])
+        attempt = 0
         while True:
             self.current_url = url_used
             try:
-                for entry in self.__limit_handled(cursor.items()):
-                    entry_handler(self, from_tweepy_obj_to_json(entry))
-                return
-            except RotateKeys:
-                self.__handle_rate_limit()
-                old_cursor = cursor
-                cursor = tweepy.Cursor(getattr(self.api, apiname), **kwargs)
-                cursor.iterator.next_cursor = old_cursor.iterator.next_cursor
-                cursor.iterator.prev_cursor = old_cursor.iterator.next_cursor
-                cursor.iterator.num_tweets = old_cursor.iterator.num_tweets
+                for page in self.__limit_handled(iterator):
+                    attempt = 0
+                    self.__handle_page(page, position, entry_handler, lock, prepare, batch_size)
+                    with lock:
+                        for name in CURSOR_FIELDS:
+                            if hasattr(iterator, name):
+                                position[name] = getattr(iterator, name)
+                        position['handled'] = 0
+                    if self.state is not None:
+                        self.state.checkpoint()
+                break
             except Exception as e:
-                self.__handle_exception(e)
+                attempt += 1
+                self.__handle_exception(e, attempt)
+        if self.state is not None:
+            self.state.finish_cursor(key)
+
+    def __handle_page(self, page, position, entry_handler, lock, prepare=None, batch_size=None):
+        '''
+        passes the entries of a page not handled yet to entry_handler, counting them in position,
+        they are prepared before the lock is taken so other cursors can store their entries meanwhile
+        '''
+        entries = [from_tweepy_obj_to_json(entry) for entry in page_entries(page)][position.get('handled', 0):]
+        step = batch_size or 1
+        for i in range(0, len(entries), step):
+            batch = entries[i:i + step]
+            if prepare is not None:
+                batch = prepare(batch)
+            with lock:
+                for entry in batch:
+                    if entry is None:
+                        position['handled'] = position.get('handled', 0) + 1
+                        continue
+                    try:
+                        entry_handler(self, entry)
+                    except StopQuery:
+                        position['handled'] = position.get('handled', 0) + 1
+                        raise
+                    position['handled'] = position.get('handled', 0) + 1
+
+    def __query_ids(self, url_used, entry_handler, apiname, hydrate, **kwargs):
+        '''
+        queries a tweepy api returning user ids using cursors, the ids are
+        looked up in batches of 100 if hydrate is set, which is rate limited
+        separately, otherwise entries only hold the id of the user
+        '''
+        if not hydrate:
+            def callback(obj, user_id):
+                entry_handler(self, {'id': user_id})
+
+            self.__query_api_with_cursor(url_used, callback, apiname, **kwargs)
+            return
+
+        def lookup_batch(user_ids):
+            profiles = {profile['id']: profile for profile in self.lookup_users(user_ids)}
+            # users that no longer exist are skipped
+            return [profiles.get(user_id) for user_id in user_ids]
+
+        self.__query_api_with_cursor(url_used, lambda obj, profile: entry_handler(self, profile), apiname, prepare=lookup_batch, batch_size=100, **kwargs)
 
     def __query_api_with_stream(self, entry_handler, **kwargs):
-        '''queries a tweepy api using streams handling errors and rate limits'''
-        while True:
+        '''
+        queries a tweepy api using streams handling errors and rate limits
+
+        with several keys the stream moves to the next one every stream_rotation
+        seconds, the new stream is connected before the old one is closed and
+        the tweets both of them receive meanwhile are only handled once
+
+        the streams only queue the statuses, stream_threads threads process
+        them and call entry_handler at the same time
+        '''
+        lock = threading.Lock()
+        # ids of the tweets received while two streams are open
+        overlap_ids = None
+        metrics = StreamMetrics()
+        self.stream_metrics = metrics
+
+        def enqueue(listener, status):
+            with lock:
+                if overlap_ids is not None:
+                    status_id = status['id'] if isinstance(status, dict) else status.id
+                    if status_id in overlap_ids:
+                        return
+                    overlap_ids.add(status_id)
+            statuses.put((listener, status, time.time()))
+
+        def process(item):
+            listener, status, received = item
+            started = time.time()
+            metrics.observe('queue', started - received)
+            tweet = from_tweepy_obj_to_json(status)
+            entry_handler(listener, tweet)
+            metrics.observe('process', time.time() - started)
+
+        statuses = Pipeline(process, self.stream_threads, self.stream_queue_size, name='stream')
+        metrics.queue = statuses
+        if self.stream_api_in_use not in self.twitter_apis:
+            self.stream_api_in_use = self.api_in_use
+        stream = self.__open_stream(self.stream_api_in_use, enqueue, metrics, kwargs)
+        last_rotation = time.time()
+        attempt = 0
+        try:
+            while True:
+                stream.thread.join(1)
+                if statuses.error is not None:
+                    raise statuses.error
+                if not stream.thread.is_alive():
+                    error = stream.listener.error
+                    if error is None:
+                        return
+                    if not isinstance(error, Exception):
+                        raise error
+                    # streams that connected before failing start their backoff again
+                    attempt = 1 if stream.listener.connected.is_set() else attempt + 1
+                    self.__handle_exception(error, attempt, stream.twitter_api)
+                    stream = self.__open_stream(self.stream_api_in_use, enqueue, metrics, kwargs)
+                    last_rotation = time.time()
+                    continue
+
+                rotate = self.stream_rotation is not None and len(self.twitter_apis) > 1
+                if rotate and time.time() - last_rotation > self.stream_rotation:
+                    last_rotation = time.time()
+                    with lock:
+                        overlap_ids = set()
+                    old_stream = stream
+                    try:
+                        stream = self.__rotate_stream(old_stream, enqueue, metrics, kwargs)
+                    finally:
+                        with lock:
+                            overlap_ids = None
+                    error = old_stream.listener.error
+                    if stream is not old_stream and error is not None:
+                        # the old stream failed during the overlap, the new one goes on
+                        if not isinstance(error, Exception):
+                            raise error
+                        self.__handle_exception(error, twitter_api=old_stream.twitter_api)
+        finally:
+            stream.disconnect()
+            # the statuses already received are processed
+            statuses.close()
+
+    def __open_stream(self, twitter_api, enqueue, metrics, kwargs):
+        '''starts a stream with a key in a thread of its own'''
+        listener = StreamListener(self, enqueue, metrics)
+        stream = Stream(auth=self.__authenticate(twitter_api).auth, listener=listener)
+        stream.twitter_api = twitter_api
+
+        def run():
             try:
-                stream_listener = StreamListener(self, entry_handler)
-                stream = tweepy.Stream(auth=self.api.auth, listener=stream_listener)
-                stream.filter(**kwargs)
-                return
-            except RotateKeys:
-                self.__rotate_apikey()
-            except Exception as e:
-                self.__handle_exception(e)
+                stream.filter(stall_warnings=True, **kwargs)
+            except BaseException as e:
+                listener.error = listener.error or e
+
+        stream.thread = threading.Thread(target=run, name='stream', daemon=True)
+        stream.thread.start()
+        return stream
 
-    def __query_api_raw(self, url_used, api, *args, **kwargs):
+    def __rotate_stream(self, old_stream, enqueue, metrics, kwargs):
+        '''
+        opens a stream with the next key and closes the old one once the new one
+        is connected, returns the stream left open
+        '''
+        stream = self.__open_stream(self.__next_apikey(old_stream.twitter_api), enqueue, metrics, kwargs)
+        try:
+            deadline = time.time() + STREAM_CONNECT_TIMEOUT
+            while not stream.listener.connected.wait(1):
+                if time.time() > deadline or not stream.thread.is_alive() or not old_stream.thread.is_alive():
+                    # the old stream is kept and the rotation tried again on the next interval
+                    stream.disconnect()
+                    return old_stream
+            old_stream.thread.join(STREAM_OVERLAP)
+        except BaseException:
+            stream.disconnect()
+            raise
+        old_stream.disconnect()
+        self.stream_api_in_use = stream.twitter_api
+        return stream
+
+    def __query_api_raw(self, url_used, apiname, *args, **kwargs):
         '''queries a tweepy api handling errors and rate limits'''
+        api = self.__limited_method(url_used, apiname)
+        attempt = 0
         while True:
             self.current_url = url_used
             try:
                 result = api(*args, **kwargs)
                 return from_tweepy_obj_to_json(result)
-            except tweepy.RateLimitError:
-                self.__handle_rate_limit()
+            except tweepy.error.TweepError as e:
+                if not is_rate_limit_error(e):
+                    attempt += 1
+                    self.__handle_exception(e, attempt)
             except Exception as e:
-                self.__handle_exception(e)
+                attempt += 1
+                self.__handle_exception(e, attempt)
 
-    def __handle_exception(self, e):
-        '''handle many known from tweepy/twitter'''
+    def __limited_method(self, url_used, apiname):
+        '''
+        returns a tweepy api method that picks the key with the most requests
+        left on the endpoint before each call and records the rate limit
+        headers of the response, and the failures of the endpoint with the
+        key for its circuit breaker
+        '''
+        def method(*args, **kwargs):
+            if kwargs.get('create'):
+                # tweepy id cursors call the method to build their models, it sends no request
+                return getattr(self.api, apiname)(*args, **kwargs)
+            key = self.limiter.acquire(url_used, [key_id(twitter_api) for twitter_api in self.twitter_apis])
+            self.retry.before(url_used, key)
+            api = self.__use_key(key)
+            try:
+                result = getattr(api, apiname)(*args, **kwargs)
+            except tweepy.error.TweepError as e:
+                if is_rate_limit_error(e):
+                    self.limiter.exhausted(key, url_used, response_headers(api))
+                elif is_transient_error(e):
+                    self.retry.failure(url_used, key)
+                raise
+            self.limiter.update(key, url_used, response_headers(api))
+            self.retry.success(url_used, key)
+            return result
+
+        # tweepy cursors read the pagination mode from the method
+        method.pagination_mode = getattr(getattr(self.api, apiname), 'pagination_mode', None)
+        if method.pagination_mode is None:
+            del method.pagination_mode
+        return method
+
+    def __use_key(self, key):
+        '''makes the key the one in use and returns its api'''
+        for twitter_api in self.twitter_apis:
+            if key_id(twitter_api) == key:
+                break
+        else:
+            raise Exception('API Key not found')
+        if twitter_api is not self.api_in_use:
+            self.api_in_use = twitter_api
+            self.api = self.__authenticate(twitter_api)
+        return self.api
+
+    def __handle_exception(self, e, attempt=1, twitter_api=None):
+        '''
+        handle many known from tweepy/twitter, transient errors wait before their
+        retry number attempt, twitter_api is the key that failed if it is not the
+        one in use
+        '''
         msg = str(e)
 
-        # exception commonly thrown by cursors
-        if type(e) == http.client.IncompleteRead:
-            time.sleep(5)
-        # exception commonly thrown by cursors
-        elif type(e) == requests.exceptions.ConnectionError:
-            time.sleep(5)
-        # exception commonly thrown by strams
-        elif type(e) == urllib3.exceptions.ProtocolError:
-            time.sleep(5)
-        # tweepy failed to send the request
-        elif 'Failed to send request' in msg:
-            time.sleep(5)
+        # connection errors and incomplete reads of cursors and streams, requests tweepy
+        # failed to send and 5xx, the twitter servers are up but overloaded or failing
+        if is_transient_error(e):
+            self.retry.wait(attempt, retry_after(e))
 
         # twitter specific exception
         # https://developer.twitter.com/en/support/twitter-api/error-troubleshooting
 
         # 429
         # Returned when a request cannot be served due to the App's rate limit having been exhausted for the resource.
+        # the key was marked as exhausted, the next request waits or uses another key
         elif 'Too Many Requests' in msg:
-            self.__handle_rate_limit()
-        # 503
-        # The Twitter servers are up, but overloaded with requests. Try again later.
-        elif 'Service Unavailable' in msg:
-            time.sleep(60)
+            pass
         # 89
         # Corresponds with HTTP 403. The access token used in the request is incorrect or has expired.
         elif 'Invalid or expired token' in msg:
-            invalid_api_key = self.api_in_use
+            invalid_api_key = twitter_api or self.api_in_use
             print('got \'Invalid or expired token\' error')
             print('is this api key valid?\n{}'.format(json.dumps(invalid_api_key, indent=4, sort_keys=True)))
             if len(self.twitter_apis) == 1:
                 sys.exit()
             else:
                 print('removing api key...')
-                self.__rotate_apikey()
+                if self.api_in_use == invalid_api_key:
+                    self.api_in_use = self.__next_apikey(invalid_api_key)
+                    self.api = self.__authenticate(self.api_in_use)
+                if self.stream_api_in_use == invalid_api_key:
+                    self.stream_api_in_use = self.__next_apikey(invalid_api_key)
                 self.twitter_apis = [key for key in self.twitter_apis if key != invalid_api_key]
         else:
             # print('got unknown error: {}'.format(str(e)))
@@ -165,6 +588,7 @@ class Twitter:
         if self.type == '':
             self.type = 'get_retweeters'
 
+        self.limiter.declare('/statuses/retweeters/ids', request_per_window)
         user_id = self.statuses_lookup([tweet_id])[0]['user']['id']
 
         def callback(obj, retweeter_uid):
@@ -183,14 +607,43 @@ class Twitter:
         request_per_window = 300
         if self.type == '':
             self.type = 'statuses_lookup'
+        self.limiter.declare('/statuses/lookup', request_per_window)
 
         tweets_data = []
         while len(tweet_ids) > 0:
             batch = tweet_ids[:max_per_request]
             tweet_ids = tweet_ids[max_per_request:]
-            tweets_data += self.__query_api_raw('/statuses/lookup', self.api.statuses_lookup, batch)
+            tweets_data += self.__query_api_raw('/statuses/lookup', 'statuses_lookup', batch)
         return tweets_data
 
+    def lookup_users(self, user_ids=None, screen_names=None):
+        '''returns the profiles of a list of user ids or screen names, suspended or deleted users are left out'''
+        if self.type == '':
+            self.type = 'lookup_users'
+        return self.__lookup_users(user_ids, screen_names)
+
+    def __lookup_users(self, user_ids=None, screen_names=None):
+        # https://developer.twitter.com/en/docs/twitter-api/v1/accounts-and-users/follow-search-get-users/api-reference/get-users-lookup
+        max_per_request = 100
+        request_per_window = 900
+        self.limiter.declare('/users/lookup', request_per_window)
+
+        if user_ids is not None:
+            name, users = 'user_ids', user_ids
+        else:
+            name, users = 'screen_names', screen_names
+        profiles = []
+        while len(users) > 0:
+            batch = users[:max_per_request]
+            users = users[max_per_request:]
+            try:
+                profiles += self.__query_api_raw('/users/lookup', 'lookup_users', **{name: batch})
+            except tweepy.error.TweepError as e:
+                # 17, none of the users of the batch exist anymore
+                if e.api_code != 17:
+                    raise
+        return profiles
+
     def get_retweeters_new(self, tweet_ids, entry_handler):
         '''returns the new retweeters from a given tweet'''
         if self.type == '':
@@ -207,13 +660,20 @@ class Twitter:
 
         self.get_timeline_new(user_ids, callback)
 
-    def get_followers(self, user, entry_handler, max_results=None):
-        '''returns the followers of a user, ordered from new to old'''
+    def get_followers(self, user, entry_handler, max_results=None, ids=None):
+        '''
+        returns the followers of a user, ordered from new to old
+        if ids is 'hydrate' or 'edges' they are paged by id, 5000 per request,
+        and then looked up in batches of 100 or returned as bare ids
+        '''
         # https://developer.twitter.com/en/docs/twitter-api/v1/accounts-and-users/follow-search-get-users/api-reference/get-followers-list
-        count = 200
+        # https://developer.twitter.com/en/docs/twitter-api/v1/accounts-and-users/follow-search-get-users/api-reference/get-followers-ids
+        count = 200 if ids is None else 5000
         request_per_window = 15
         if self.type == '':
-            self.type = 'get_followers'
+            self.type = 'get_followers_ids' if ids == 'edges' else 'get_followers'
+        self.limiter.declare('/followers/list', request_per_window)
+        self.limiter.declare('/followers/ids', request_per_window)
         profile = self.get_profile(user)
         if profile['protected']:
             print('the account {} is not public'.format(profile['screen_name']))
@@ -231,15 +691,25 @@ class Twitter:
             entry_handler(self, entry)
             number_of_followers += 1
 
+        if ids is not None:
+            self.__query_ids('/followers/ids', callback, 'followers_ids', ids == 'hydrate', user_id=profile['id'], count=count)
+            return
         self.__query_api_with_cursor('/followers/list', callback, 'followers', id=user, count=count)
 
-    def get_friends(self, user, entry_handler, max_results=None):
-        '''returns the users that the user follows'''
+    def get_friends(self, user, entry_handler, max_results=None, ids=None):
+        '''
+        returns the users that the user follows
+        if ids is 'hydrate' or 'edges' they are paged by id, 5000 per request,
+        and then looked up in batches of 100 or returned as bare ids
+        '''
         # https://developer.twitter.com/en/docs/twitter-api/v1/accounts-and-users/follow-search-get-users/api-reference/get-friends-list
-        count = 200
+        # https://developer.twitter.com/en/docs/twitter-api/v1/accounts-and-users/follow-search-get-users/api-reference/get-friends-ids
+        count = 200 if ids is None else 5000
         request_per_window = 15
         if self.type == '':
-            self.type = 'get_friends'
+            self.type = 'get_friends_ids' if ids == 'edges' else 'get_friends'
+        self.limiter.declare('/friends/list', request_per_window)
+        self.limiter.declare('/friends/ids', request_per_window)
         profile = self.get_profile(user)
         if profile['protected']:
             print('the account {} is not public'.format(profile['screen_name']))
@@ -254,16 +724,162 @@ class Twitter:
             entry['is_followed_by'] = profile
             entry_handler(self, entry)
 
+        if ids is not None:
+            self.__query_ids('/friends/ids', callback, 'friends_ids', ids == 'hydrate', user_id=user_id, count=count)
+            return
         self.__query_api_with_cursor('/friends/list', callback, 'friends', id=user_id, count=count)
 
+    def crawl(self, method, users, entry_handler, max_results=None, **kwargs):
+        '''
+        runs get_followers, get_friends or get_timeline for a list of users
+        with one thread per api key, or per user with a share of the keys if
+        there are fewer users, each thread takes the next user once it finishes
+        its cursor and the results of all of them reach entry_handler
+        '''
+        # the profiles of all the users are looked up together before the threads start
+        self.get_profiles(users)
+        targets = queue.Queue()
+        for user in users:
+            targets.put(user)
+
+        def work(twitter_apis, handler):
+            child = self.__child(twitter_apis)
+            while True:
+                try:
+                    user = targets.get_nowait()
+                except queue.Empty:
+                    return
+                getattr(child, method)(user, handler, max_results, **kwargs)
+
+        self.__run_workers(work, entry_handler, min(len(self.twitter_apis), len(users)))
+
+    def crawl_graph(self, seeds, entry_handler, frontier, hops, direction='followers', hop_limit=None, ids=None):
+        '''
+        expands the seed users hop by hop through their followers, friends or both,
+        the users of a hop are taken from the frontier by priority, expanded in
+        parallel with one thread per api key, and the users found are added to
+        the next hop, hop_limit caps the number of users expanded per hop
+        '''
+        methods = ['get_followers', 'get_friends'] if direction == 'both' else [f'get_{direction}']
+        seed_ids = [int(user_id) for user_id in self.__name_to_id(seeds)]
+        frontier.discover([(user_id, None) for user_id in seed_ids], 0)
+
+        for hop in range(hops):
+            started = frontier.expanded(hop)
+            pending = frontier.pending(hop)
+            if hop_limit is not None:
+                pending = min(pending, max(0, hop_limit - started))
+            if pending == 0:
+                continue
+            print('hop {}: expanding {} users'.format(hop, pending))
+            claim_lock = threading.Lock()
+
+            def next_user():
+                nonlocal started
+                with claim_lock:
+                    if hop_limit is not None and started >= hop_limit:
+                        return None
+                    user_id = frontier.claim(hop)
+                    if user_id is not None:
+                        started += 1
+                    return user_id
+
+            def work(twitter_apis, handler):
+                # one twitter per method, so the entries of each keep their type
+                children = {method: self.__child(twitter_apis, '') for method in methods}
+                while True:
+                    user_id = next_user()
+                    if user_id is None:
+                        return
+                    neighbors = []
+
+                    def callback(obj, entry):
+                        if hop + 1 < hops:
+                            neighbors.append((entry['id'], entry.get('followers_count')))
+                            if len(neighbors) >= DISCOVER_BATCH_SIZE:
+                                frontier.discover(neighbors, hop + 1)
+                                neighbors.clear()
+                        handler(obj, entry)
+
+                    for method in methods:
+                        try:
+                            getattr(children[method], method)(str(user_id), callback, ids=ids)
+                        except tweepy.error.TweepError as e:
+                            # suspended or deleted users are skipped
+                            print('skipping user {}: {}'.format(user_id, e))
+                    if neighbors:
+                        frontier.discover(neighbors, hop + 1)
+                    frontier.done(user_id, hop)
+
+            self.__run_workers(work, entry_handler, min(len(self.twitter_apis), pending))
+
+    def __child(self, twitter_apis, type=None):
+        '''returns a twitter using some of the keys, sharing the rate limits with the rest'''
+        child = Twitter(twitter_apis, self.limiter, self.raw_json)
+        child.search_id = self.search_id
+        child.type = self.type if type is None else type
+        child.state = self.state
+        child.since_ids = self.since_ids
+        child.profiles = self.profiles
+        child.retry = self.retry
+        return child
+
+    def __run_workers(self, work, entry_handler, num_workers):
+        '''
+        calls work(twitter_apis, handler) in num_workers threads, the api keys are
+        shared among them so with fewer targets than keys every key is still used,
+        the entries passed to handler reach entry_handler one at a time
+        '''
+        handler_lock = threading.Lock()
+        stop = threading.Event()
+        errors = []
+
+        def handler(obj, entry):
+            if stop.is_set():
+                raise KeyboardInterrupt
+            with handler_lock:
+                entry_handler(obj, entry)
+
+        def worker(twitter_apis):
+            try:
+                work(twitter_apis, handler)
+            except BaseException as e:
+                if not stop.is_set():
+                    errors.append(e)
+                stop.set()
+
+        shares = [self.twitter_apis[i::num_workers] for i in range(num_workers)]
+        workers = [threading.Thread(target=worker, args=(twitter_apis,), daemon=True) for twitter_apis in shares]
+        for thread in workers:
+            thread.start()
+        try:
+            for thread in workers:
+                # join with a timeout so Ctrl-C reaches the main thread
+                while thread.is_alive():
+                    thread.join(1)
+        except KeyboardInterrupt:
+            stop.set()
+            # let the entry being handled finish before the outputs are closed
+            with handler_lock:
+                raise
+        if errors:
+            raise errors[0]
+
     def get_profile(self, user):
         '''returns the profile information of a user'''
-        # https://developer.twitter.com/en/docs/twitter-api/v1/accounts-and-users/follow-search-get-users/api-reference/get-users-show
-        request_per_window = 900
         if self.type == '':
             self.type = 'get_profile'
+        profile = self.get_profiles([user]).get(user)
+        if profile is None:
+            raise tweepy.error.TweepError(f'User not found: {user}', api_code=50)
+        return profile
 
-        return self.__query_api_raw('/users/show', self.api.get_user, id=user)
+    def get_profiles(self, users):
+        '''
+        returns a dict with the profiles of a list of user ids and usernames,
+        cached or looked up 100 at a time, users that do not exist are left out
+        '''
+        return self.profiles.resolve(users, self.__lookup_users)
 
     def get_timeline(self, user, entry_handler, max_results=None):
         '''returns up to 3.200 of a user's most recent tweets'''
@@ -272,30 +888,42 @@ class Twitter:
         request_per_window = 1500
         if self.type == '':
             self.type = 'get_timeline'
+        self.limiter.declare('/statuses/user_timeline', request_per_window)
         profile = self.get_profile(user)
         if profile['protected']:
             print('the account {} is not public'.format(profile['screen_name']))
             return
+        since_key = '/statuses/user_timeline {}'.format(profile['id'])
+        kwargs = self.__since_id_kwargs(since_key)
         if max_results is None:
             max_results = profile['statuses_count']
         statuses_count = min(3200, max_results, profile['statuses_count'])
-        self.__show_running_time(statuses_count, count, request_per_window)
+        if 'since_id' not in kwargs:
+            self.__show_running_time(statuses_count, count, request_per_window)
         if self.type == '':
             self.type = 'get_timeline'
+        newest_id = kwargs.get('since_id', 0)
 
         def callback(obj, entry):
+            nonlocal newest_id
+            newest_id = max(newest_id, entry['id'])
             entry['type'] = 'tweet' if 'retweeted_status' not in entry else 'retweet'
             entry_handler(self, entry)
 
-        self.__query_api_with_cursor('/statuses/user_timeline', callback, 'user_timeline', id=user, include_rts=True, count=count)
+        self.__query_api_with_cursor('/statuses/user_timeline', callback, 'user_timeline', id=user, include_rts=True, count=count, **kwargs)
+        self.__save_since_id(since_key, newest_id)
 
     def get_timeline_new(self, users, entry_handler, get_all=False):
         '''returns new tweets of a list of users'''
         if self.type == '':
             self.type = 'get_timeline_new'
+        profiles = self.get_profiles(users)
         user_ids = []
         for user in users:
-            profile = self.get_profile(user)
+            profile = profiles.get(user)
+            if profile is None:
+                print('the account {} does not exist'.format(user))
+                return
             if profile['protected']:
                 print('the account {} is not public'.format(profile['screen_name']))
                 return
@@ -308,36 +936,136 @@ class Twitter:
 
         self.__query_api_with_stream(callback, follow=user_ids)
 
-    def search(self, q, entry_handler):
-        '''searches for already published tweets that match the search'''
+    def search(self, q, entry_handler, slices=None):
+        '''
+        searches for already published tweets that match the search, if slices
+        is set the search is split in that many disjoint id ranges searched in
+        parallel, with one thread per api key
+        '''
         # https://developer.twitter.com/en/docs/twitter-api/v1/tweets/search/api-reference/get-search-tweets
         count = 100
         request_per_window = 450
         if self.type == '':
             self.type = 'search'
+        self.limiter.declare('/search/tweets', request_per_window)
+        since_key = '/search/tweets {}'.format(q)
+        kwargs = self.__since_id_kwargs(since_key)
+        newest_id = kwargs.get('since_id', 0)
 
         def callback(obj, entry):
+            nonlocal newest_id
+            newest_id = max(newest_id, entry['id'])
             entry['search'] = q
             entry_handler(self, entry)
 
-        self.__query_api_with_cursor('/search/tweets', callback, 'search', q=q, count=count)
+        if slices is not None and slices > 1:
+            self.__search_in_slices(q, callback, slices, count=count, **kwargs)
+        else:
+            self.__query_api_with_cursor('/search/tweets', callback, 'search', q=q, count=count, **kwargs)
+        self.__save_since_id(since_key, newest_id)
 
-    def stream_callback(self, obj, tweet, entry_handler):
+    def __search_in_slices(self, q, entry_handler, slices, since_id=None, **kwargs):
+        '''
+        splits the time covered by the search api, or the time since since_id,
+        in id ranges estimated from the time encoded in tweet ids, each range
+        is searched with its own cursor by the next free api key
+        '''
+        bounds = self.state.get(f'slices {q}') if self.state is not None else None
+        if bounds is None:
+            end = time.time()
+            start = end - SEARCH_WINDOW
+            if since_id is not None:
+                start = max(start, time_from_snowflake(since_id))
+            bounds = [snowflake_from_time(start + (end - start) * i / slices) for i in range(slices + 1)]
+            # the oldest range starts at since_id, or has no lower bound, and the newest has no upper bound
+            bounds[0] = since_id
+            bounds[-1] = None
+            if self.state is not None:
+                # a resumed search keeps the ranges its cursors were saved with
+                self.state.set(f'slices {q}', bounds)
+        targets = queue.Queue()
+        for i in range(slices):
+            targets.put((bounds[i], bounds[i + 1]))
+
+        def work(twitter_apis, handler):
+            child = self.__child(twitter_apis)
+            while True:
+                try:
+                    range_since_id, range_max_id = targets.get_nowait()
+                except queue.Empty:
+                    return
+                # since_id is exclusive and max_id inclusive, so the ranges do not overlap
+                range_kwargs = dict(kwargs)
+                if range_since_id is not None:
+                    range_kwargs['since_id'] = range_since_id
+                if range_max_id is not None:
+                    range_kwargs['max_id'] = range_max_id
+                child.__query_api_with_cursor('/search/tweets', handler, 'search', q=q, **range_kwargs)
+
+        self.__run_workers(work, lambda obj, entry: entry_handler(self, entry), min(len(self.twitter_apis), slices))
+
+    def __since_id_kwargs(self, since_key):
+        '''returns the since_id parameter of an incremental query, empty the first time it runs'''
+        if self.since_ids is None:
+            return {}
+        since_id = self.since_ids.get('since_ids', {}).get(since_key)
+        if since_id is None:
+            return {}
+        return {'since_id': since_id}
+
+    def __save_since_id(self, since_key, newest_id):
+        '''
+        stores the newest tweet id of an incremental query, only once the
+        query finished, so tweets older than an interrupted run are not skipped
+        '''
+        if self.since_ids is None or newest_id == 0:
+            return
+        with self.since_ids.lock:
+            since_ids = self.since_ids.get('since_ids', {})
+            since_ids[since_key] = newest_id
+            self.since_ids.set('since_ids', since_ids)
+            self.since_ids.checkpoint(force=True)
+
+    def stream_callback(self, obj, tweet, entry_handler, replies=None):
+        '''
+        emits a tweet of a stream, with the tweet it replies to if it is a reply,
+        replies is the resolver looking up those tweets in batches, without it
+        they are looked up one by one
+        '''
         is_retweet = 'retweeted_status' in tweet
         is_reply = tweet['in_reply_to_status_id_str'] is not None
         is_quote = 'quoted_status' in tweet
 
+        if replies is not None:
+            replies.check()
+            # tweets seen in the stream are not looked up again when replied to
+            replies.add(tweet['id'], tweet)
+            for embedded in ['retweeted_status', 'quoted_status']:
+                if embedded in tweet:
+                    replies.add(tweet[embedded]['id'], tweet[embedded])
+
         if is_retweet:
             entry = {}
             entry['type'] = 'retweet'
             entry['tweet'] = tweet
             entry_handler(self, entry)
         elif is_reply:
-            entry = {}
-            entry['type'] = 'reply'
-            entry['tweet'] = tweet
-            entry['replied_to'] = self.statuses_lookup([tweet['in_reply_to_status_id_str']])[0]
-            entry_handler(self, entry)
+            def emit_reply(replied_to):
+                entry = {}
+                entry['tweet'] = tweet
+                if replied_to is None:
+                    # the tweet replied to was deleted or is not public
+                    entry['type'] = 'tweet'
+                else:
+                    entry['type'] = 'reply'
+                    entry['replied_to'] = replied_to
+                entry_handler(self, entry)
+
+            if replies is None:
+                replied_to = self.statuses_lookup([tweet['in_reply_to_status_id_str']])
+                emit_reply(replied_to[0] if len(replied_to) > 0 else None)
+            else:
+                replies.resolve(tweet['in_reply_to_status_id'], emit_reply)
         elif is_quote:
             entry = {}
             entry['type'] = 'quote'
@@ -349,42 +1077,69 @@ class Twitter:
             entry['tweet'] = tweet
             entry_handler(self, entry)
 
+    def __stream_with_replies(self, entry_handler, query):
+        '''
+        runs a stream query with the callback given to query, the replies
+        are emitted from a resolver thread once the tweets they reply to
+        are looked up, the other tweets from the stream threads, so
+        entry_handler is called from several threads and has to be thread safe
+        '''
+        def lookup(tweet_ids):
+            return {tweet['id']: tweet for tweet in self.statuses_lookup(tweet_ids)}
+
+        replies = BatchResolver(lookup, REPLY_CACHE_SIZE, name='reply-lookup')
+
+        def callback(obj, entry):
+            self.stream_callback(obj, entry, entry_handler, replies)
+
+        try:
+            query(callback)
+        finally:
+            # the replies still waiting for their lookup are emitted
+            replies.close()
+
     def search_new(self, q, entry_handler):
         '''returns new tweets that match the search'''
         if self.type == '':
             self.type = 'search_new'
 
-        def callback(obj, entry):
-            self.stream_callback(obj, entry, entry_handler)
+        def query(callback):
+            self.__query_api_with_stream(callback, track=q.split(' '))
 
-        self.__query_api_with_stream(callback, track=q.split(' '))
+        self.__stream_with_replies(entry_handler, query)
 
     def watch(self, users, entry_handler):
         '''saves all the tweets and its retweets for a list of users'''
         if self.type == '':
             self.type = 'watch'
+        profiles = self.get_profiles(users)
         user_ids = []
         for user in users:
-            profile = self.get_profile(user)
+            profile = profiles.get(user)
+            if profile is None:
+                print('the account {} does not exist'.format(user))
+                return
             if profile['protected']:
                 print('the account {} is not public'.format(profile['screen_name']))
                 return
             user_ids.append(profile['id_str'])
 
-        def callback(obj, entry):
-            self.stream_callback(obj, entry, entry_handler)
+        def query(callback):
+            self.get_timeline_new(user_ids, callback, get_all=True)
 
-        self.get_timeline_new(user_ids, callback, get_all=True)
+        self.__stream_with_replies(entry_handler, query)
 
     def __name_to_id(self, id_name_list):
         '''takes a list of usernames and returns a list of ids'''
+        profiles = self.get_profiles([id_name for id_name in id_name_list if not is_user_id(id_name)])
         id_list = []
         for id_name in id_name_list:
-            if re.search(r'^\d+$', id_name):
+            if is_user_id(id_name):
                 id_list.append(id_name)
+            elif id_name in profiles:
+                id_list.append(str(profiles[id_name]['id']))
             else:
-                profile = self.get_profile(id_name)
-                id_list.append(str(profile['id']))
+                raise tweepy.error.TweepError(f'User not found: {id_name}', api_code=50)
         return id_list
 
     def __show_running_time(self, records_amount, count, request_per_window):
@@ -414,64 +1169,46 @@ class Twitter:
 
     def __authenticate(self, credentials):
         '''authenticates to twitter with the given credentials'''
+        key = key_id(credentials)
+        if key in self.clients:
+            return self.clients[key]
         auth = tweepy.OAuthHandler(credentials['CONSUMER_KEY'], credentials['CONSUMER_SECRET'])
         auth.set_access_token(credentials['ACCESS_KEY'], credentials['ACCESS_SECRET'])
-        api = tweepy.API(auth)
+        api = tweepy.API(auth, parser=JSONParser() if self.raw_json else None, compression=True)
+        self.clients[key] = api
         return api
 
-    def __rotate_apikey(self):
-        '''used for streams, rotates the api key being used'''
-        if len(self.twitter_apis) == 1:
-            return
-        for i, twitter_api in enumerate(self.twitter_apis):
-            if twitter_api == self.api_in_use:
-                self.api_in_use = self.twitter_apis[(i + 1) % len(self.twitter_apis)]
-                self.api = self.__authenticate(self.api_in_use)
-                return
+    def __next_apikey(self, twitter_api):
+        '''returns the key after twitter_api, used to rotate the keys of streams'''
+        for i, key in enumerate(self.twitter_apis):
+            if key == twitter_api:
+                return self.twitter_apis[(i + 1) % len(self.twitter_apis)]
         raise Exception('API Key not found')
 
     def __limit_handled(self, cursor):
-        '''used by cursors, handles exceptions and rate limits'''
+        '''
+        used by cursors, handles exceptions and rate limits, transient errors
+        are retried with backoff and unknown ones raised after a few retries
+        '''
+        attempt = 0
         while True:
             try:
-                yield cursor.next()
+                page = cursor.next()
             except StopIteration:
                 return
-            except tweepy.RateLimitError:
-                raise RotateKeys()
             except tweepy.error.TweepError as e:
-                if 'status code = 429' in str(e):
-                    raise RotateKeys()
-                elif 'Failed to send request' in str(e):
-                    time.sleep(5)
+                if is_rate_limit_error(e):
+                    # the page is requested again, with another key or once the window resets
                     continue
-                else:
+                attempt += 1
+                if not is_transient_error(e):
+                    if attempt > self.retry.max_attempts:
+                        raise
                     print('got unknown error: {}'.format(str(e)))
-                    time.sleep(5)
-                    continue
-
-    def __handle_rate_limit(self):
-        '''
-        changes the API key being used based on their expiration status
-        if all keys are expired, it waits the smallest amount of time possible
-        '''
-        now = time.time()
-        self.api_in_use['expired_at'][self.current_url] = now
-
-        if len(self.twitter_apis) == 1:
-            time.sleep(15 * 60)
-            return
-
-        valid_apis = [twitter_api for twitter_api in self.twitter_apis if self.current_url not in twitter_api['expired_at'] or now - twitter_api['expired_at'][self.current_url] >= 15 * 60]
-        if len(valid_apis) > 0:
-            self.api_in_use = valid_apis[0]
-            self.api = self.__authenticate(self.api_in_use)
-        else:
-            self.twitter_apis.sort(reverse=False, key=lambda api: api['expired_at'][self.current_url])
-            self.api_in_use = self.twitter_apis[0]
-            time_expired = now - self.api_in_use['expired_at'][self.current_url]
-            time.sleep(15 * 60 - time_expired + 3)
-            self.api = self.__authenticate(self.api_in_use)
+                self.retry.wait(attempt, retry_after(e))
+                continue
+            attempt = 0
+            yield page
 
 
 def from_tweepy_obj_to_json(tweepy_obj):
@@ -484,3 +1221,48 @@ def from_tweepy_obj_to_json(tweepy_obj):
         return tweepy_obj._json
     else:
         return tweepy_obj
+
+
+def page_entries(page):
+    '''returns the entries of a page, the json pages of cursors are dicts holding them'''
+    if isinstance(page, dict):
+        for name in ['users', 'ids', 'statuses']:
+            if name in page:
+                return page[name]
+    return page
+
+
+def is_transient_error(e):
+    '''returns True for errors that usually go away on their own: failed connections and twitter server errors'''
+    if isinstance(e, (http.client.IncompleteRead, requests.exceptions.ConnectionError, urllib3.exceptions.ProtocolError)):
+        return True
+    msg = str(e)
+    if 'Failed to send request' in msg or 'Service Unavailable' in msg:
+        return True
+    response = getattr(e, 'response', None)
+    return getattr(response, 'status_code', 0) >= 500
+
+
+def is_rate_limit_error(e):
+    '''returns True if twitter rejected the request because of rate limits'''
+    if isinstance(e, tweepy.RateLimitError):
+        return True
+    return e.api_code == 88 or 'status code = 429' in str(e)
+
+
+def response_headers(api):
+    '''returns the headers of the last response received by a tweepy api'''
+    response = getattr(api, 'last_response', None)
+    if response is None:
+        return {}
+    return response.headers
+
+
+def snowflake_from_time(timestamp):
+    '''returns the smallest tweet id that can be created at a unix time'''
+    return (int(timestamp * 1000) - SNOWFLAKE_EPOCH) << 22
+
+
+def time_from_snowflake(tweet_id):
+    '''returns the unix time a tweet id was created at'''
+    return ((int(tweet_id) >> 22) + SNOWFLAKE_EPOCH) / 1000
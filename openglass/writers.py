@@ -0,0 +1,288 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import io
+import os
+import csv
+import gzip
+import time
+import atexit
+import threading
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from .serialize import dumps
+
+# a writer is flushed to disk once it buffers this many bytes
+# or once this many seconds have passed since its last flush
+FLUSH_SIZE = 64 * 1024
+FLUSH_INTERVAL = 5
+
+# csv rows are encoded with writerows in batches of this many rows
+CSV_BATCH_SIZE = 500
+
+COMPRESSIONS = ['gzip', 'zstd']
+COMPRESSION_EXTENSIONS = {'gzip': '.gz', 'zstd': '.zst'}
+
+# compression of the output files and the size in bytes, number of rows
+# and age in seconds after which a new file is started, None disables them
+COMPRESSION = None
+ROTATE_SIZE = None
+ROTATE_ENTRIES = None
+ROTATE_INTERVAL = None
+
+# global variables holding the writers opened during the run, one per file
+writers = {}
+writers_lock = threading.Lock()
+flusher = None
+
+
+class BufferedWriter:
+    '''
+    keeps an output file open for the whole run and
+    writes the buffered rows in batches
+
+    if rotation is enabled the rows are written to numbered segments,
+    <filename>_<start_time>_<seq>, and each finished segment is recorded
+    in <filename>_<start_time>.manifest.jsonl
+    '''
+
+    def __init__(self, path, header=None, flush_size=None, flush_interval=None, compression=None,
+                 rotate_size=None, rotate_entries=None, rotate_interval=None):
+        self.path = path
+        self.header = encode_rows([header]) if header is not None else None
+        self.flush_size = flush_size or FLUSH_SIZE
+        self.flush_interval = flush_interval or FLUSH_INTERVAL
+        self.compression = compression
+        self.rotate_size = rotate_size
+        self.rotate_entries = rotate_entries
+        self.rotate_interval = rotate_interval
+        self.rotating = any([rotate_size, rotate_entries, rotate_interval])
+        self.stem, self.extension = os.path.splitext(path)
+        self.lock = threading.Lock()
+        self.buffer = []
+        self.buffered = 0
+        self.rows = []
+        self.last_flush = time.time()
+        self.file = None
+        self.seq = 0
+        self.__open_segment()
+
+    def write(self, data):
+        '''buffers a row, flushing when the size or time threshold is reached'''
+        with self.lock:
+            self.buffer.append(data)
+            self.buffered += len(data)
+            self.segment_rows += 1
+            self.segment_bytes += len(data)
+            if self.buffered >= self.flush_size or time.time() - self.last_flush >= self.flush_interval:
+                self.__flush()
+            if self.__should_rotate():
+                self.__rotate()
+
+    def write_row(self, row):
+        '''buffers a csv row, rows are encoded in batches'''
+        with self.lock:
+            self.rows.append(row)
+            self.segment_rows += 1
+            if len(self.rows) >= CSV_BATCH_SIZE:
+                self.__encode_rows()
+            if self.buffered >= self.flush_size or time.time() - self.last_flush >= self.flush_interval:
+                self.__flush()
+            if self.__should_rotate():
+                self.__rotate()
+
+    def flush(self, stale_only=False):
+        '''writes the buffered rows, optionally only if the time threshold was reached'''
+        with self.lock:
+            if self.file is None:
+                return
+            if self.__should_rotate():
+                self.__rotate()
+            if stale_only and time.time() - self.last_flush < self.flush_interval:
+                return
+            self.__flush()
+
+    def close(self):
+        with self.lock:
+            if self.file is None:
+                return
+            self.__close_segment()
+
+    def __segment_path(self):
+        path = self.path
+        if self.rotating:
+            path = f'{self.stem}_{self.seq:04d}{self.extension}'
+        if self.compression is not None:
+            path += COMPRESSION_EXTENSIONS[self.compression]
+        return path
+
+    def __open_segment(self):
+        self.seq += 1
+        self.segment_path = self.__segment_path()
+        # a resumed run does not overwrite the segments of the previous one
+        while self.rotating and os.path.isfile(self.segment_path):
+            self.seq += 1
+            self.segment_path = self.__segment_path()
+        store_header = self.header is not None and not os.path.isfile(self.segment_path)
+        fd = os.open(self.segment_path, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o660)
+        self.raw_file = os.fdopen(fd, 'ab', buffering=0)
+        if self.compression == 'gzip':
+            self.file = gzip.GzipFile(fileobj=self.raw_file, mode='ab')
+        elif self.compression == 'zstd':
+            self.file = zstandard.ZstdCompressor().stream_writer(self.raw_file, closefd=False)
+        else:
+            self.file = self.raw_file
+        self.segment_rows = 0
+        self.segment_bytes = 0
+        self.segment_opened_at = time.time()
+        if store_header:
+            self.buffer.append(self.header)
+            self.buffered += len(self.header)
+
+    def __close_segment(self):
+        self.__flush()
+        if self.file is not self.raw_file:
+            self.file.close()
+        self.raw_file.close()
+        self.file = None
+        if self.rotating and self.segment_rows > 0:
+            self.__add_to_manifest()
+
+    def __add_to_manifest(self):
+        segment = {
+            'path': os.path.basename(self.segment_path),
+            'seq': self.seq,
+            'rows': self.segment_rows,
+            'bytes': self.segment_bytes,
+            'size': os.path.getsize(self.segment_path),
+            'opened_at': int(self.segment_opened_at),
+            'closed_at': int(time.time()),
+        }
+        with open(f'{self.stem}.manifest.jsonl', 'ab') as f:
+            f.write(dumps(segment) + b'\n')
+
+    def __should_rotate(self):
+        if not self.rotating or self.segment_rows == 0:
+            return False
+        if self.rotate_entries and self.segment_rows >= self.rotate_entries:
+            return True
+        if self.rotate_size and self.segment_bytes >= self.rotate_size:
+            return True
+        if self.rotate_interval and time.time() - self.segment_opened_at >= self.rotate_interval:
+            return True
+        return False
+
+    def __rotate(self):
+        self.__close_segment()
+        self.__open_segment()
+
+    def __encode_rows(self):
+        if self.rows:
+            data = encode_rows(self.rows)
+            self.rows = []
+            self.buffer.append(data)
+            self.buffered += len(data)
+            self.segment_bytes += len(data)
+
+    def __flush(self):
+        self.__encode_rows()
+        if self.buffer:
+            self.file.write(b''.join(self.buffer))
+            self.buffer = []
+            self.buffered = 0
+        self.last_flush = time.time()
+
+
+def encode_rows(rows):
+    '''encodes rows as csv'''
+    f = io.StringIO()
+    csv.writer(f, lineterminator='\n').writerows(rows)
+    return f.getvalue().encode('utf-8')
+
+
+def configure_writers(flush_size=None, flush_interval=None, compression=None,
+                      rotate_size=None, rotate_entries=None, rotate_interval=None):
+    '''changes the settings used by the writers opened from now on'''
+    global FLUSH_SIZE, FLUSH_INTERVAL, COMPRESSION, ROTATE_SIZE, ROTATE_ENTRIES, ROTATE_INTERVAL
+    if compression == 'zstd' and zstandard is None:
+        raise Exception('zstd compression requires zstandard, install it with: pip install zstandard')
+    if flush_size:
+        FLUSH_SIZE = flush_size
+    if flush_interval:
+        FLUSH_INTERVAL = flush_interval
+    COMPRESSION = compression
+    ROTATE_SIZE = rotate_size
+    ROTATE_ENTRIES = rotate_entries
+    ROTATE_INTERVAL = rotate_interval
+
+
+def open_writer(path, header=None):
+    '''returns the writer of a file, opening it the first time it is used'''
+    global flusher
+    writer = writers.get(path)
+    if writer is not None:
+        return writer
+    with writers_lock:
+        if path not in writers:
+            writers[path] = BufferedWriter(path, header, compression=COMPRESSION, rotate_size=ROTATE_SIZE,
+                                           rotate_entries=ROTATE_ENTRIES, rotate_interval=ROTATE_INTERVAL)
+        if flusher is None:
+            flusher = threading.Thread(target=flush_periodically, daemon=True)
+            flusher.start()
+        return writers[path]
+
+
+def flush_periodically():
+    '''flushes the writers that received no rows for a while'''
+    while True:
+        time.sleep(FLUSH_INTERVAL)
+        for writer in list(writers.values()):
+            writer.flush(stale_only=True)
+
+
+def flush_writers():
+    for writer in list(writers.values()):
+        writer.flush()
+
+
+def writer_sizes():
+    '''
+    flushes the writers and returns the size of the file each one is writing,
+    by file name so it does not depend on how the output directory was given
+    '''
+    sizes = {}
+    for writer in list(writers.values()):
+        writer.flush()
+        sizes[os.path.basename(writer.segment_path)] = os.path.getsize(writer.segment_path)
+    return sizes
+
+
+def truncate_files(paths, sizes, saved_at):
+    '''
+    brings files back to the sizes they had at a checkpoint saved at saved_at,
+    files it does not know are removed if they were written after it
+    '''
+    for path in paths:
+        size = sizes.get(os.path.basename(path))
+        if size is None:
+            if os.path.getmtime(path) >= saved_at:
+                os.remove(path)
+            else:
+                print('leaving {}, it is not part of the checkpoint'.format(path))
+        elif os.path.getsize(path) > size:
+            os.truncate(path, size)
+
+
+def close_writers():
+    '''flushes and closes all the writers, used when openglass exits'''
+    with writers_lock:
+        for writer in writers.values():
+            writer.close()
+        writers.clear()
+
+
+atexit.register(close_writers)
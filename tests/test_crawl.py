@@ -0,0 +1,58 @@
+import time
+import threading
+
+import openglass.twitter as twitter
+
+
+KEYS = [{'CONSUMER_KEY': f'key{i}', 'CONSUMER_SECRET': 's', 'ACCESS_KEY': f'access{i}', 'ACCESS_SECRET': 's'} for i in range(3)]
+
+# the followers of every user come in pages of 10 ids
+PAGES = 6
+
+
+class FakeAPI:
+
+    def __init__(self, credentials, requests):
+        self.key = credentials['CONSUMER_KEY']
+        self.requests = requests
+
+    def followers_ids(self, cursor=-1, user_id=None, **kwargs):
+        self.requests.append(self.key)
+        # a request takes long enough for every worker to take a user
+        time.sleep(0.01)
+        page = 0 if cursor == -1 else cursor
+        next_cursor = page + 1 if page + 1 < PAGES else 0
+        return [user_id * 1000 + page * 10 + i for i in range(10)], (page - 1 if page > 0 else 0, next_cursor)
+
+    followers_ids.pagination_mode = 'cursor'
+
+    def lookup_users(self, user_ids=None, screen_names=None):
+        return [{'id': int(user_id), 'id_str': str(user_id), 'screen_name': f'user{user_id}', 'protected': False, 'followers_count': PAGES * 10}
+                for user_id in user_ids or screen_names]
+
+
+def crawl_followers(monkeypatch, users):
+    requests = []
+    lock = threading.Lock()
+    monkeypatch.setattr(twitter.Twitter, '_Twitter__authenticate', lambda self, credentials: FakeAPI(credentials, requests))
+    t = twitter.Twitter(KEYS)
+    followers = []
+
+    def handler(obj, entry):
+        with lock:
+            followers.append(entry['id'])
+
+    t.crawl('get_followers', users, handler, ids='edges')
+    return followers, requests
+
+
+def test_crawl_of_a_single_user_uses_every_key(monkeypatch):
+    followers, requests = crawl_followers(monkeypatch, ['1'])
+    assert sorted(followers) == [1000 + i for i in range(PAGES * 10)]
+    assert sorted(set(requests)) == ['key0', 'key1', 'key2']
+
+
+def test_crawl_shares_the_keys_among_fewer_users(monkeypatch):
+    followers, requests = crawl_followers(monkeypatch, ['1', '2'])
+    assert len(set(followers)) == 2 * PAGES * 10
+    assert sorted(set(requests)) == ['key0', 'key1', 'key2']
@@ -0,0 +1,90 @@
+import os
+
+from openglass.dedup import DedupStore, ExactSet, edge_key
+
+
+def test_exact_set_adds_each_key_once():
+    keys = ExactSet(buffer_size=7)
+    for key in range(100):
+        assert keys.add(key)
+    for key in range(100):
+        assert not keys.add(key)
+        assert key in keys
+    assert 100 not in keys
+    assert len(keys) == 100
+
+
+def test_exact_set_of_pairs():
+    keys = ExactSet(key_size=16, buffer_size=7)
+    for src in range(20):
+        for dst in range(5):
+            assert keys.add(edge_key(src, dst))
+    assert not keys.add(edge_key(3, 4))
+    assert edge_key(4, 3) in keys
+    assert edge_key(3, 5) not in keys
+    assert edge_key(5, 3) != edge_key(3, 5)
+    assert len(keys) == 100
+
+
+def test_exact_store_with_many_keys(tmp_path):
+    path = str(tmp_path / 'users.exact')
+    count = 70000
+    store = DedupStore(path=path)
+    for key in range(1, count + 1):
+        assert store.add(key)
+    assert not store.add(count)
+    store.save()
+
+    loaded = DedupStore(path=path)
+    assert len(loaded) == count
+    assert all(key in loaded for key in range(1, count + 1, 997))
+    assert not loaded.add(1)
+    assert loaded.add(count + 1)
+
+
+def test_exact_store_appends_new_keys(tmp_path):
+    path = str(tmp_path / 'follows.exact')
+    store = DedupStore(path=path, key_size=16)
+    store.add(edge_key(1, 2))
+    store.save()
+    store.add(edge_key(3, 4))
+    store.save()
+    store.save()
+    assert os.path.getsize(path) == 32
+
+    # a save interrupted halfway leaves an incomplete key, which is dropped
+    with open(path, 'ab') as f:
+        f.write(b'\x01\x02\x03')
+    loaded = DedupStore(path=path, key_size=16)
+    assert len(loaded) == 2
+    assert edge_key(3, 4) in loaded
+    assert os.path.getsize(path) == 32
+
+
+def test_bloom_store_round_trip(tmp_path):
+    path = str(tmp_path / 'users.bloom')
+    store = DedupStore('bloom', capacity=10000, error_rate=0.001, path=path)
+    for key in range(1000):
+        assert store.add(key)
+    assert not store.add(10)
+    store.save()
+
+    loaded = DedupStore('bloom', capacity=10000, error_rate=0.001, path=path)
+    assert len(loaded) == 1000
+    assert all(key in loaded for key in range(1000))
+    for key in range(1000, 1100):
+        loaded.add(key)
+    loaded.save()
+
+    reloaded = DedupStore('bloom', capacity=10000, error_rate=0.001, path=path)
+    assert all(key in reloaded for key in range(1100))
+    assert sum(key in reloaded for key in range(10 ** 6, 10 ** 6 + 10000)) < 100
+
+
+def test_bloom_store_sized_differently_starts_empty(tmp_path):
+    path = str(tmp_path / 'users.bloom')
+    store = DedupStore('bloom', capacity=10000, error_rate=0.001, path=path)
+    store.add(1)
+    store.save()
+    loaded = DedupStore('bloom', capacity=20000, error_rate=0.001, path=path)
+    assert 1 not in loaded
@@ -0,0 +1,39 @@
+import threading
+
+from openglass import standarize_entry
+
+
+class Query:
+    search_id = 'search'
+    type = 'search_new'
+
+
+def test_standarize_entry_leaves_shared_dicts_alone():
+    user = {'id': 1, 'id_str': '1', 'profile_link_color': 'fff'}
+    parent = {'id': 2, 'id_str': '2', 'favorited': False, 'user': user}
+    entry = standarize_entry(Query(), {'type': 'reply', 'tweet': {'id': 3, 'user': user}, 'replied_to': parent}, 10)
+
+    assert entry['replied_to'] == {'id': 2, 'user': {'id': 1}}
+    assert entry['tweet'] == {'id': 3, 'user': {'id': 1}}
+    assert entry['og_type'] == 'search_new'
+    assert entry['og_timestamp'] == 10
+    assert parent == {'id': 2, 'id_str': '2', 'favorited': False, 'user': {'id': 1, 'id_str': '1', 'profile_link_color': 'fff'}}
+
+
+def test_standarize_entry_from_several_threads():
+    parent = {'id': 2, 'id_str': '2', 'favorited': False, 'user': {'id': 1, 'id_str': '1'}}
+    errors = []
+
+    def work():
+        try:
+            for _ in range(2000):
+                standarize_entry(Query(), {'type': 'reply', 'replied_to': parent})
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
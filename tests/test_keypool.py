@@ -0,0 +1,74 @@
+import threading
+
+import pytest
+
+from openglass import keypool
+from openglass.keypool import KeyPool
+
+
+class Waited(Exception):
+    pass
+
+
+@pytest.fixture
+def slept(monkeypatch):
+    '''the seconds acquire tried to sleep, it raises Waited instead'''
+    slept = []
+
+    def sleep(seconds):
+        slept.append(seconds)
+        raise Waited()
+
+    monkeypatch.setattr(keypool.time, 'sleep', sleep)
+    return slept
+
+
+def headers(limit, remaining, reset):
+    return {'x-rate-limit-limit': str(limit), 'x-rate-limit-remaining': str(remaining), 'x-rate-limit-reset': str(reset)}
+
+
+def test_pools_sharing_a_database_never_lease_the_same_request(tmp_path, slept):
+    path = str(tmp_path / 'keypool.sqlite')
+    pools = [KeyPool(path) for _ in range(4)]
+    pools[0].declare('/followers/ids', 50)
+    leased = []
+    lock = threading.Lock()
+
+    def lease(pool):
+        for _ in range(25):
+            key = pool.acquire('/followers/ids', ['a', 'b'])
+            with lock:
+                leased.append(key)
+
+    threads = [threading.Thread(target=lease, args=(pool,)) for pool in pools]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # both windows are used up exactly, none of the pools had to wait
+    assert slept == []
+    assert leased.count('a') == 50
+    assert leased.count('b') == 50
+    with pytest.raises(Waited):
+        pools[1].acquire('/followers/ids', ['a', 'b'])
+    for pool in pools:
+        pool.close()
+
+
+def test_headers_reach_the_other_processes(tmp_path, slept):
+    path = str(tmp_path / 'keypool.sqlite')
+    first = KeyPool(path)
+    second = KeyPool(path)
+    reset = int(keypool.time.time()) + 300
+    first.update('a', '/users/lookup', headers(900, 0, reset))
+    second.update('b', '/users/lookup', headers(900, 2, reset))
+    assert [first.acquire('/users/lookup', ['a', 'b']) for _ in range(2)] == ['b', 'b']
+    with pytest.raises(Waited):
+        second.acquire('/users/lookup', ['a', 'b'])
+    assert len(slept) == 1 and slept[0] > 290
+
+
+def test_exhausted_key_is_skipped(tmp_path):
+    pool = KeyPool(str(tmp_path / 'keypool.sqlite'))
+    pool.exhausted('a', '/search/tweets')
+    assert all(pool.acquire('/search/tweets', ['a', 'b']) == 'b' for _ in range(10))
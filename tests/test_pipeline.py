@@ -0,0 +1,106 @@
+import threading
+
+import pytest
+
+from openglass.pipeline import Pipeline
+
+
+def gated_pipeline(drop_policy, maxsize=3):
+    '''pipeline whose single worker waits for the gate before each item'''
+    gate = threading.Event()
+    started = threading.Event()
+    processed = []
+
+    def worker(item):
+        started.set()
+        gate.wait()
+        processed.append(item)
+
+    return Pipeline(worker, maxsize=maxsize, drop_policy=drop_policy), gate, started, processed
+
+
+def test_block_processes_every_item_in_order():
+    processed = []
+    pipeline = Pipeline(processed.append, maxsize=2)
+    for i in range(100):
+        pipeline.put(i)
+    pipeline.close()
+    assert processed == list(range(100))
+    assert pipeline.stats()['processed'] == 100
+    assert pipeline.stats()['dropped'] == 0
+
+
+def test_drop_new_discards_the_items_that_do_not_fit():
+    pipeline, gate, started, processed = gated_pipeline('drop-new')
+    pipeline.put(0)
+    started.wait()
+    for i in range(1, 10):
+        pipeline.put(i)
+    # one item is being processed and three are queued
+    assert pipeline.stats()['dropped'] == 6
+    gate.set()
+    pipeline.wait()
+    pipeline.close()
+    assert processed == [0, 1, 2, 3]
+
+
+def test_drop_old_keeps_the_newest_items():
+    pipeline, gate, started, processed = gated_pipeline('drop-old')
+    pipeline.put(0)
+    started.wait()
+    for i in range(1, 10):
+        pipeline.put(i)
+    assert pipeline.stats()['dropped'] == 6
+    gate.set()
+    pipeline.close()
+    assert processed == [0, 7, 8, 9]
+
+
+def test_wait_returns_once_the_items_up_to_a_sequence_are_finished():
+    gate = threading.Event()
+    processed = []
+
+    def worker(item):
+        if item == 'slow':
+            gate.wait()
+        processed.append(item)
+
+    pipeline = Pipeline(worker, num_workers=2, maxsize=10)
+    pipeline.put('slow')
+    pipeline.put('fast')
+    sequence = pipeline.sequence
+    waited = threading.Event()
+
+    def wait():
+        pipeline.wait(sequence)
+        waited.set()
+
+    threading.Thread(target=wait, daemon=True).start()
+    # the slow item put before is not finished yet
+    assert not waited.wait(0.1)
+    assert processed == ['fast']
+    gate.set()
+    assert waited.wait(5)
+    pipeline.close()
+    assert processed == ['fast', 'slow']
+
+
+def test_worker_errors_reach_the_producer():
+    def worker(item):
+        if item == 3:
+            raise ValueError('bad item')
+
+    pipeline = Pipeline(worker, maxsize=100)
+    for i in range(5):
+        pipeline.put(i)
+    with pytest.raises(ValueError):
+        pipeline.wait()
+    with pytest.raises(ValueError):
+        pipeline.put(5)
+    with pytest.raises(ValueError):
+        pipeline.close()
+
+
+def test_unknown_drop_policy():
+    with pytest.raises(Exception):
+        Pipeline(print, drop_policy='drop-all')
@@ -0,0 +1,78 @@
+import pytest
+
+from openglass import ratelimit
+from openglass.ratelimit import RateLimiter, parse_headers
+
+
+class Clock:
+    '''replaces time.time and time.sleep, sleeping moves the clock forward'''
+
+    def __init__(self, monkeypatch):
+        self.now = 1000000.0
+        self.slept = []
+        monkeypatch.setattr(ratelimit.time, 'time', lambda: self.now)
+        monkeypatch.setattr(ratelimit.time, 'sleep', self.sleep)
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+def headers(limit, remaining, reset):
+    return {'x-rate-limit-limit': str(limit), 'x-rate-limit-remaining': str(remaining), 'x-rate-limit-reset': str(reset)}
+
+
+def test_acquire_spreads_requests_over_the_keys(monkeypatch):
+    Clock(monkeypatch)
+    limiter = RateLimiter()
+    limiter.declare('/followers/ids', 15)
+    keys = [limiter.acquire('/followers/ids', ['a', 'b', 'c']) for _ in range(30)]
+    assert sorted(keys.count(key) for key in 'abc') == [10, 10, 10]
+
+
+def test_acquire_sleeps_until_the_first_window_resets(monkeypatch):
+    clock = Clock(monkeypatch)
+    limiter = RateLimiter()
+    limiter.declare('/users/lookup', 2)
+    for _ in range(4):
+        limiter.acquire('/users/lookup', ['a', 'b'])
+    limiter.update('b', '/users/lookup', headers(2, 0, int(clock.now) + 100))
+    assert clock.slept == []
+    assert limiter.acquire('/users/lookup', ['a', 'b']) == 'b'
+    assert clock.slept == [100 + ratelimit.RESET_MARGIN]
+
+
+def test_update_never_gives_back_requests_reserved_after_the_response(monkeypatch):
+    clock = Clock(monkeypatch)
+    limiter = RateLimiter()
+    reset = int(clock.now) + 500
+    limiter.update('a', '/search/tweets', headers(180, 100, reset))
+    for _ in range(10):
+        limiter.acquire('/search/tweets', ['a'])
+    # the response of the first of those requests arrives after the others were sent
+    limiter.update('a', '/search/tweets', headers(180, 99, reset))
+    for _ in range(90):
+        limiter.acquire('/search/tweets', ['a'])
+    assert clock.slept == []
+    limiter.acquire('/search/tweets', ['a'])
+    assert clock.slept == [500 + ratelimit.RESET_MARGIN]
+
+
+def test_exhausted_key_is_skipped_until_its_reset(monkeypatch):
+    clock = Clock(monkeypatch)
+    limiter = RateLimiter()
+    limiter.exhausted('a', '/statuses/user_timeline', headers(900, 0, int(clock.now) + 60))
+    assert all(limiter.acquire('/statuses/user_timeline', ['a', 'b']) == 'b' for _ in range(10))
+    clock.now += 61
+    assert limiter.acquire('/statuses/user_timeline', ['a', 'b']) == 'a'
+
+
+def test_acquire_without_keys():
+    with pytest.raises(Exception):
+        RateLimiter().acquire('/users/lookup', [])
+
+
+def test_parse_headers():
+    assert parse_headers(headers(15, 3, 1600000000)) == [15, 3, 1600000000]
+    assert parse_headers({'x-rate-limit-remaining': 'x'}) == [None, None, None]
+    assert parse_headers(None) == [None, None, None]
@@ -0,0 +1,78 @@
+from types import SimpleNamespace
+
+from openglass import retry
+from openglass.retry import RetryPolicy, retry_after
+
+
+class Clock:
+    '''replaces time.time and time.sleep, sleeping moves the clock forward'''
+
+    def __init__(self, monkeypatch):
+        self.now = 1000000.0
+        self.slept = []
+        monkeypatch.setattr(retry.time, 'time', lambda: self.now)
+        monkeypatch.setattr(retry.time, 'sleep', self.sleep)
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+def test_delay_grows_with_the_attempts_up_to_the_maximum():
+    policy = RetryPolicy(base_delay=1, max_delay=60)
+    for attempt in range(1, 10):
+        delays = [policy.delay(attempt) for _ in range(200)]
+        assert all(0 <= delay <= min(60, 2 ** attempt) for delay in delays)
+    # full jitter spreads the retries over the whole range
+    assert max(policy.delay(3) for _ in range(200)) > 4
+
+
+def test_retry_after_is_used_when_twitter_sends_it(monkeypatch):
+    clock = Clock(monkeypatch)
+    policy = RetryPolicy(max_delay=60)
+    policy.wait(1, retry_after=7)
+    policy.wait(1, retry_after=600)
+    assert clock.slept == [7, 60]
+    assert policy.stats()['retries'] == 2
+    assert policy.stats()['time_lost'] == 67
+
+
+def test_breaker_opens_after_consecutive_failures(monkeypatch):
+    clock = Clock(monkeypatch)
+    policy = RetryPolicy(breaker_threshold=3, breaker_cooldown=60)
+    for _ in range(2):
+        policy.failure('/users/lookup', 'a')
+    policy.success('/users/lookup', 'a')
+    for _ in range(2):
+        policy.failure('/users/lookup', 'a')
+    policy.before('/users/lookup', 'a')
+    assert clock.slept == []
+
+    policy.failure('/users/lookup', 'a')
+    assert policy.stats()['circuits_opened'] == 1
+    # other keys and endpoints are not affected
+    policy.before('/users/lookup', 'b')
+    policy.before('/search/tweets', 'a')
+    assert clock.slept == []
+
+    clock.now += 20
+    policy.before('/users/lookup', 'a')
+    assert clock.slept == [40]
+    # after the cooldown one request tries again, the next ones wait for another cooldown
+    policy.before('/users/lookup', 'a')
+    assert clock.slept == [40, 60]
+    policy.success('/users/lookup', 'a')
+    policy.before('/users/lookup', 'a')
+    assert clock.slept == [40, 60]
+    assert policy.stats()['open_circuits'] == 0
+
+
+def test_retry_after_header():
+    def error(headers):
+        return Exception() if headers is None else SimpleNamespace(response=SimpleNamespace(headers=headers))
+
+    assert retry_after(error({'retry-after': '30'})) == 30
+    assert retry_after(error({'retry-after': '-5'})) == 0
+    assert retry_after(error({'retry-after': 'soon'})) is None
+    assert retry_after(error({})) is None
+    assert retry_after(error(None)) is None
@@ -0,0 +1,76 @@
+import time
+import threading
+
+import openglass.twitter as twitter
+from openglass.twitter import snowflake_from_time, time_from_snowflake, SEARCH_WINDOW
+
+
+KEYS = [{'CONSUMER_KEY': f'key{i}', 'CONSUMER_SECRET': 's', 'ACCESS_KEY': f'access{i}', 'ACCESS_SECRET': 's'} for i in range(3)]
+
+NOW = 1600000000.0
+SLICES = 4
+
+
+def slice_bounds():
+    start = NOW - SEARCH_WINDOW
+    return [snowflake_from_time(start + SEARCH_WINDOW * i / SLICES) for i in range(1, SLICES)]
+
+
+# a tweet every 10 minutes of the search window, and tweets right at the bounds of the slices
+TWEETS = sorted(set([snowflake_from_time(NOW - i * 600) + i for i in range(SEARCH_WINDOW // 600)] +
+                    [bound + delta for bound in slice_bounds() for delta in [-1, 0, 1]]), reverse=True)
+
+
+class FakeAPI:
+
+    def __init__(self, credentials, requests):
+        self.key = credentials['CONSUMER_KEY']
+        self.requests = requests
+
+    def search(self, q=None, count=100, since_id=None, max_id=None, **kwargs):
+        self.requests.append(self.key)
+        # a request takes long enough for every worker to take a slice
+        time.sleep(0.01)
+        statuses = [tweet_id for tweet_id in TWEETS
+                    if (since_id is None or tweet_id > since_id) and (max_id is None or tweet_id <= max_id)]
+        return {'statuses': [{'id': tweet_id, 'id_str': str(tweet_id), 'text': q} for tweet_id in statuses[:count]]}
+
+    search.pagination_mode = 'id'
+
+
+def search(monkeypatch, slices, since_id=None):
+    requests = []
+    monkeypatch.setattr(twitter.Twitter, '_Twitter__authenticate', lambda self, credentials: FakeAPI(credentials, requests))
+    monkeypatch.setattr(twitter.time, 'time', lambda: NOW)
+    t = twitter.Twitter(KEYS, raw_json=True)
+    t.limiter.declare('/search/tweets', 450)
+    found = []
+    lock = threading.Lock()
+
+    def handler(obj, entry):
+        with lock:
+            found.append(entry['id'])
+
+    kwargs = {}
+    if since_id is not None:
+        kwargs['since_id'] = since_id
+    t._Twitter__search_in_slices('x', handler, slices, count=100, **kwargs)
+    return found, requests
+
+
+def test_slices_cover_the_window_without_overlapping(monkeypatch):
+    found, requests = search(monkeypatch, SLICES)
+    assert sorted(found, reverse=True) == TWEETS
+    assert sorted(set(requests)) == ['key0', 'key1', 'key2']
+
+
+def test_slices_start_after_since_id(monkeypatch):
+    since_id = TWEETS[len(TWEETS) // 3]
+    found, _ = search(monkeypatch, SLICES, since_id=since_id)
+    assert sorted(found, reverse=True) == [tweet_id for tweet_id in TWEETS if tweet_id > since_id]
+
+
+def test_snowflake_round_trip():
+    assert time_from_snowflake(snowflake_from_time(NOW)) == NOW
+    assert time_from_snowflake(snowflake_from_time(NOW) + (1 << 22) - 1) < NOW + 0.001
+    assert snowflake_from_time(NOW + 0.001) > snowflake_from_time(NOW)
@@ -0,0 +1,27 @@
+from datetime import datetime
+
+import pytest
+
+from openglass import serialize
+
+
+@pytest.mark.parametrize('backend', ['auto', 'json'] + [name for name in ['orjson', 'ujson'] if getattr(serialize, name) is not None])
+def test_pretty_output_does_not_depend_on_the_backend(backend):
+    entry = {'b': [1, 2], 'a': {'created_at': datetime(2020, 1, 2, 3, 4, 5)}, 'text': 'café'}
+    serialize.select_backend(backend)
+    try:
+        assert serialize.dumps_pretty(entry) == (
+            '{\n'
+            '    "a": {\n'
+            '        "created_at": "2020-01-02T03:04:05"\n'
+            '    },\n'
+            '    "b": [\n'
+            '        1,\n'
+            '        2\n'
+            '    ],\n'
+            '    "text": "caf\\u00e9"\n'
+            '}'
+        )
+        assert serialize.loads(serialize.dumps(entry)) == {'b': [1, 2], 'a': {'created_at': '2020-01-02T03:04:05'}, 'text': 'café'}
+    finally:
+        serialize.select_backend()
@@ -0,0 +1,89 @@
+import pytest
+
+import openglass.twitter as twitter
+from openglass.state import StateStore
+
+
+KEYS = [{'CONSUMER_KEY': 'key', 'CONSUMER_SECRET': 's', 'ACCESS_KEY': 'access', 'ACCESS_SECRET': 's'}]
+
+# three pages of follower ids, the users with an id divisible by 7 no longer exist
+PAGES = [list(range(1000 + 250 * page, 1250 + 250 * page)) for page in range(3)]
+FOLLOWERS = [user_id for page in PAGES for user_id in page if user_id % 7 != 0]
+
+
+def profile(user_id, screen_name=None):
+    return {
+        'id': user_id,
+        'id_str': str(user_id),
+        'screen_name': screen_name or f'user{user_id}',
+        'protected': False,
+        'followers_count': 750,
+    }
+
+
+class FakeAPI:
+
+    def __init__(self, credentials):
+        self.lookups = []
+
+    def followers_ids(self, cursor=-1, **kwargs):
+        page = 0 if cursor == -1 else cursor
+        next_cursor = page + 1 if page + 1 < len(PAGES) else 0
+        return PAGES[page], (page - 1 if page > 0 else 0, next_cursor)
+
+    followers_ids.pagination_mode = 'cursor'
+
+    def lookup_users(self, user_ids=None, screen_names=None):
+        if screen_names is not None:
+            return [profile(1, screen_name) for screen_name in screen_names]
+        self.lookups.append(list(user_ids))
+        return [profile(user_id) for user_id in user_ids if user_id % 7 != 0]
+
+
+@pytest.fixture
+def fake_api(monkeypatch):
+    monkeypatch.setattr(twitter.Twitter, '_Twitter__authenticate', lambda self, credentials: FakeAPI(credentials))
+
+
+def get_followers(state, stop_after=None):
+    t = twitter.Twitter(KEYS)
+    t.state = state
+    followers = []
+
+    def handler(obj, entry):
+        followers.append(entry['id'])
+        if len(followers) == stop_after:
+            raise twitter.StopQuery()
+
+    try:
+        t.get_followers('target', handler, ids='hydrate')
+    except twitter.StopQuery:
+        state.checkpoint(force=True)
+    return followers
+
+
+def test_hydrated_cursor_resumes_where_it_stopped(fake_api, tmp_path):
+    state = StateStore(str(tmp_path), interval=0)
+    # stops in the middle of the second batch of lookups of the second page
+    first = get_followers(state, stop_after=300)
+    assert first == FOLLOWERS[:300]
+
+    (position,) = state.get('cursors').values()
+    # the cursor of the second page, which was not finished
+    assert position['next_cursor'] == 1
+    # the entries of the page are counted up to the one that stopped the query, deleted users included
+    assert position['handled'] == PAGES[1].index(first[-1]) + 1
+
+    resumed = StateStore(str(tmp_path), interval=0)
+    assert resumed.load()
+    second = get_followers(resumed)
+    assert first + second == FOLLOWERS
+    assert resumed.get('cursors') == {}
+
+
+def test_cursor_without_state_reads_every_page(fake_api):
+    t = twitter.Twitter(KEYS)
+    followers = []
+    t.get_followers('target', lambda obj, entry: followers.append(entry), ids='hydrate')
+    assert [entry['id'] for entry in followers] == FOLLOWERS
+    assert all(entry['follows']['screen_name'] == 'target' for entry in followers)
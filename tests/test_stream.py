@@ -0,0 +1,99 @@
+import time
+import threading
+import itertools
+import functools
+
+import pytest
+import tweepy
+
+import openglass.twitter as twitter
+from openglass.lookup import BatchResolver
+
+
+KEYS = [{'CONSUMER_KEY': f'key{i}', 'CONSUMER_SECRET': 's', 'ACCESS_KEY': f'access{i}', 'ACCESS_SECRET': 's'} for i in range(2)]
+
+
+class FakeAuth:
+
+    def __init__(self, consumer_key):
+        self.consumer_key = consumer_key
+
+
+class FakeAPI:
+
+    def __init__(self, credentials):
+        self.auth = FakeAuth(credentials['CONSUMER_KEY'])
+        self.lookups = 0
+
+    def statuses_lookup(self, tweet_ids, **kwargs):
+        self.lookups += 1
+        return [tweet(int(tweet_id)) for tweet_id in tweet_ids]
+
+
+def tweet(tweet_id, in_reply_to=None):
+    return {
+        'id': tweet_id,
+        'id_str': str(tweet_id),
+        'text': 'hello',
+        'user': {'id': 1, 'id_str': '1', 'screen_name': 'user1'},
+        'in_reply_to_status_id': in_reply_to,
+        'in_reply_to_status_id_str': None if in_reply_to is None else str(in_reply_to),
+    }
+
+
+@pytest.fixture
+def fake_streams(monkeypatch):
+    '''streams sending a reply every few milliseconds, twitter allows one connection per key'''
+    ids = itertools.count(1)
+    lock = threading.Lock()
+    connections = []
+    open_keys = []
+    conflicts = []
+
+    def filter(self, **kwargs):
+        self.running = True
+        key = self.auth.consumer_key
+        with lock:
+            if key in open_keys:
+                conflicts.append(key)
+            open_keys.append(key)
+            connections.append(key)
+        try:
+            self.listener.on_connect()
+            while self.running:
+                tweet_id = next(ids)
+                # the tweets replied to are not in the stream, they are looked up
+                status = tweepy.models.Status.parse(None, tweet(tweet_id, in_reply_to=1000000 + tweet_id))
+                if self.listener.on_status(status) is False:
+                    break
+                time.sleep(0.01)
+        finally:
+            with lock:
+                open_keys.remove(key)
+
+    monkeypatch.setattr(tweepy.Stream, 'filter', filter)
+    monkeypatch.setattr(twitter.Twitter, '_Twitter__authenticate', lambda self, credentials: FakeAPI(credentials))
+    monkeypatch.setattr(twitter, 'BatchResolver', functools.partial(BatchResolver, max_delay=0.05))
+    monkeypatch.setattr(twitter, 'STREAM_OVERLAP', 0.05)
+    return connections, conflicts
+
+
+def test_rotation_keeps_the_stream_key_apart_from_rest_requests(fake_streams):
+    connections, conflicts = fake_streams
+    t = twitter.Twitter(KEYS)
+    t.stream_rotation = 0.2
+    replies = []
+
+    def handler(obj, entry):
+        if entry['type'] == 'reply':
+            replies.append(entry['tweet']['id'])
+        if len(connections) >= 4:
+            raise twitter.StopQuery()
+
+    with pytest.raises(twitter.StopQuery):
+        t.search_new('x', handler)
+
+    assert len(replies) > 0
+    assert conflicts == []
+    # every rotation moves the stream to the other key
+    assert all(a != b for a, b in zip(connections, connections[1:]))
@@ -0,0 +1,66 @@
+import os
+import json
+import time
+
+from openglass.writers import BufferedWriter, truncate_files
+
+
+def test_rows_are_written_on_flush_and_close(tmp_path):
+    path = str(tmp_path / 'users_1.csv')
+    writer = BufferedWriter(path, header=['uid', 'name'], flush_size=1024 * 1024, flush_interval=3600)
+    writer.write_row((1, 'a'))
+    writer.write_row((2, 'b, "c"'))
+    assert os.path.getsize(path) == 0
+    writer.flush()
+    assert open(path).read() == 'uid,name\n1,a\n2,"b, ""c"""\n'
+    writer.write_row((3, 'd'))
+    writer.close()
+    assert open(path).read().endswith('3,d\n')
+
+
+def test_rotation_writes_segments_and_manifest(tmp_path):
+    path = str(tmp_path / 'search_1.jsonl')
+    writer = BufferedWriter(path, flush_interval=3600, rotate_entries=2)
+    for i in range(5):
+        writer.write(b'{"id": %d}\n' % i)
+    writer.close()
+
+    segments = sorted(name for name in os.listdir(tmp_path) if name.endswith('.jsonl') and 'manifest' not in name)
+    assert segments == ['search_1_0001.jsonl', 'search_1_0002.jsonl', 'search_1_0003.jsonl']
+    assert open(tmp_path / 'search_1_0003.jsonl').read() == '{"id": 4}\n'
+    manifest = [json.loads(line) for line in open(tmp_path / 'search_1.manifest.jsonl')]
+    assert [segment['rows'] for segment in manifest] == [2, 2, 1]
+    assert manifest[0]['path'] == 'search_1_0001.jsonl'
+    assert manifest[0]['size'] == os.path.getsize(tmp_path / 'search_1_0001.jsonl')
+
+
+def test_resumed_rotation_does_not_overwrite_segments(tmp_path):
+    path = str(tmp_path / 'search_1.jsonl')
+    writer = BufferedWriter(path, rotate_entries=10)
+    writer.write(b'first\n')
+    writer.close()
+    writer = BufferedWriter(path, rotate_entries=10)
+    writer.write(b'second\n')
+    writer.close()
+    assert open(tmp_path / 'search_1_0001.jsonl').read() == 'first\n'
+    assert open(tmp_path / 'search_1_0002.jsonl').read() == 'second\n'
+
+
+def test_truncate_files_by_name(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.mkdir('out')
+    with open('out/users_1.csv', 'w') as f:
+        f.write('uid\n1\n2\n')
+    with open('out/old_1.csv', 'w') as f:
+        f.write('uid\n1\n')
+    saved_at = time.time()
+    os.utime('out/old_1.csv', (saved_at - 60, saved_at - 60))
+    with open('out/tweets_1.csv', 'w') as f:
+        f.write('uid\n3\n')
+
+    # the checkpoint was saved by a run given out, the resumed one is given ./out
+    truncate_files(['./out/users_1.csv', './out/old_1.csv', './out/tweets_1.csv'], {'users_1.csv': 6}, saved_at)
+    assert open('out/users_1.csv').read() == 'uid\n1\n'
+    # files written after the checkpoint are removed, older unknown ones kept
+    assert not os.path.exists('out/tweets_1.csv')
+    assert os.path.exists('out/old_1.csv')